@@ -1,10 +1,17 @@
+import argparse
+import hashlib
 import json
 import os
+import threading
 import time
-from typing import List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
 from google import genai
 from google.genai import types
 from pathlib import Path
+from event_store import load_events
+from llm_cache import LLMCache
 
 client = genai.Client()
 
@@ -225,13 +232,123 @@ Output:
 {"valid":false,"discard_reason":["OUT_OF_SCOPE","NO_LOCATION"],"confidence":0.9,"rationale":"Chủ đề kinh tế/chứng khoán không thuộc 5 lĩnh vực, đồng thời không có địa điểm cụ thể."}
 """
 
-#input
+# Phần cố định gửi 1 lần dưới dạng system instruction / context cache; mỗi batch chỉ gửi seed_list
+# LƯU Ý: sửa "url: [...]" -> "url": [...] trong schema mẫu để model trả đúng key
+SYSTEM_INSTRUCTION = prompt_text + """
+
+Người dùng sẽ gửi một MẢNG JSON các sự cố dạng {"index": <int>, "noi_dung": <string>}.
+Hãy phân loại TOÀN BỘ danh sách và TRẢ VỀ DUY NHẤT MỘT MẢNG JSON, mỗi sự cố một phần tử, giữ nguyên "index".
+Mỗi phần tử có dạng:
+{
+  "index": <int>,
+  "noi_dung": <string>,
+  "valid": <bool>,
+  "linh_vuc": [...],
+  "muc_do_khan_cap": "...",
+  "location": {"text": "...", "type": "ADMIN | ROAD | LANDMARK | COORDS", "coords": {"lat": 0.0, "lon": 0.0}},
+  "alt_locations": [...],
+  "url": [...],
+  "confidence": <0..1>,
+  "rationale": "...",
+  "discard_reason": ["..."]
+}
+"""
+
+#input (định dạng cũ; load_events ưu tiên Data/events nếu có)
 INPUT_JSON = DATA_DIR / "safemap_data.json"
 
+#output + checkpoint: {event_id → index} và {event_id → content_hash đã phân loại}
+OUTPUT_JSONL = DATA_DIR / "ket_qua.jsonl"
+CHECKPOINT_FILE = DATA_DIR / "ket_qua.checkpoint.json"
+
+#Cache kết quả phân loại theo từng sự cố (model + PROMPT_VERSION + noi_dung), dùng chung với process_markers.py
+LLM_CACHE_FILE = DATA_DIR / "llm_cache.jsonl"
+PROMPT_VERSION = "classify-v2"     # tăng khi sửa prompt_text / RESPONSE_SCHEMA để bỏ kết quả cũ
+
+#Batch theo ngân sách token (ước lượng) thay vì số bài cố định; BATCH_SIZE chỉ là trần số bài
+BATCH_SIZE = 30
+BATCH_INPUT_TOKENS = 8_000         # phần seed_list, chưa tính prompt_text
+BATCH_OUTPUT_TOKENS = 8_000
+
+#Gemini: gửi nhiều batch song song, giới hạn theo quota request/phút và token/phút
+GEMINI_MODEL = "gemini-2.5-flash"
+MAX_CONCURRENT_BATCHES = 4
+RPM_LIMIT = 10
+TPM_LIMIT = 250_000
+OUTPUT_TOKENS_PER_ITEM = 200       # ước lượng token trả về cho mỗi sự cố (ngoài phần noi_dung lặp lại)
+CHARS_PER_TOKEN = 3                # ước lượng thô cho tiếng Việt
+MAX_ATTEMPTS = 3
+RETRYABLE_CODES = {429, 500, 503}
+CONTEXT_CACHE_TTL = 3600           # giây; --context-cache tạo cache phía Gemini cho SYSTEM_INSTRUCTION
+
+#JSON mode: Gemini trả đúng mảng object theo schema (khớp validate() trong ket_qua.py)
+LINH_VUC_VALUES = ["Thiên tai & Môi trường", "Giao thông & Hạ tầng", "Cháy nổ & Sự cố kỹ thuật",
+                   "An ninh Trật tự Tội phạm", "Cộng đồng & Dịch vụ"]
+MUC_DO_VALUES = ["Cảnh báo nguy hiểm", "Cảnh báo trung bình", "Nhắc nhở", "Tích cực"]
+RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "index": {"type": "INTEGER"},
+            "noi_dung": {"type": "STRING"},
+            "valid": {"type": "BOOLEAN"},
+            "linh_vuc": {"type": "ARRAY", "items": {"type": "STRING", "enum": LINH_VUC_VALUES}},
+            "muc_do_khan_cap": {"type": "STRING", "enum": MUC_DO_VALUES},
+            "location": {
+                "type": "OBJECT",
+                "nullable": True,
+                "properties": {
+                    "text": {"type": "STRING"},
+                    "type": {"type": "STRING", "enum": ["ADMIN", "ROAD", "LANDMARK", "COORDS"]},
+                    "coords": {
+                        "type": "OBJECT",
+                        "nullable": True,
+                        "properties": {"lat": {"type": "NUMBER"}, "lon": {"type": "NUMBER"}},
+                    },
+                },
+            },
+            "alt_locations": {"type": "ARRAY", "items": {"type": "STRING"}},
+            "Ngay_thang_nam": {"type": "ARRAY", "items": {"type": "STRING"}},
+            "url": {"type": "ARRAY", "items": {"type": "STRING"}},
+            "confidence": {"type": "NUMBER"},
+            "rationale": {"type": "STRING"},
+            "discard_reason": {"type": "ARRAY", "items": {"type": "STRING", "enum": ["NO_LOCATION", "OUT_OF_SCOPE", "BOTH"]}},
+        },
+        "required": ["index", "valid", "confidence", "rationale"],
+        "propertyOrdering": ["index", "valid", "linh_vuc", "muc_do_khan_cap", "location", "alt_locations",
+                             "Ngay_thang_nam", "url", "confidence", "rationale", "discard_reason", "noi_dung"],
+    },
+}
+
 # ====== Hàm tiện ích ======
-def chunk_list(items: List[str], n: int) -> List[List[str]]:
-    """Chia list thành các khúc kích thước n."""
-    return [items[i:i+n] for i in range(0, len(items), n)]
+def item_input_tokens(item: Dict) -> int:
+    return estimate_tokens(item["text"])
+
+def item_output_tokens(item: Dict) -> int:
+    """Model lặp lại noi_dung trong kết quả → output tăng theo độ dài bài"""
+    return OUTPUT_TOKENS_PER_ITEM + estimate_tokens(item["text"])
+
+def make_batches(items: List[Dict]) -> List[List[Dict]]:
+    """Gom bài liên tiếp vào batch tới khi chạm ngân sách token vào/ra hoặc BATCH_SIZE bài."""
+    batches: List[List[Dict]] = []
+    current: List[Dict] = []
+    in_tokens = out_tokens = 0
+    for item in items:
+        item_in, item_out = item_input_tokens(item), item_output_tokens(item)
+        if current and (
+            len(current) >= BATCH_SIZE
+            or in_tokens + item_in > BATCH_INPUT_TOKENS
+            or out_tokens + item_out > BATCH_OUTPUT_TOKENS
+        ):
+            batches.append(current)
+            current, in_tokens, out_tokens = [], 0, 0
+        current.append(item)
+        in_tokens += item_in
+        out_tokens += item_out
+    if current:
+        batches.append(current)
+    return batches
 
 def clean_and_parse_json(raw: str):
     """Bỏ code fences và parse JSON; fallback về list/dict rỗng nếu lỗi."""
@@ -248,6 +365,59 @@ def clean_and_parse_json(raw: str):
         except Exception:
             return None
 
+class JsonArrayStream:
+    """
+    Parser tăng dần cho mảng JSON top-level nhận theo từng mảnh (stream):
+    feed(chunk) trả về các object vừa đóng ngoặc xong, phần dở dang giữ lại chờ mảnh sau.
+    Bỏ qua mọi thứ trước '[' (vd. code fence) và sau ']'.
+    """
+
+    def __init__(self):
+        self.depth = 0          # 0: chưa gặp '[', 1: trong mảng, >=2: trong object
+        self.finished = False
+        self.in_string = False
+        self.escape = False
+        self.current: List[str] = []
+
+    def feed(self, chunk: str) -> List[Dict]:
+        objects = []
+        for ch in chunk:
+            if self.finished:
+                break
+            if self.depth == 0:
+                if ch == "[":
+                    self.depth = 1
+                continue
+            if self.depth == 1:
+                if ch == "{":
+                    self.depth = 2
+                    self.current = [ch]
+                elif ch == "]":
+                    self.finished = True
+                continue
+
+            self.current.append(ch)
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 1:
+                    try:
+                        objects.append(json.loads("".join(self.current)))
+                    except json.JSONDecodeError:
+                        pass
+                    self.current = []
+        return objects
+
 def save_jsonl(path: str, obj):
     """Ghi 1 object mỗi dòng (append, không ghi đè)."""
     with open(path, "a", encoding="utf-8") as f:
@@ -273,11 +443,75 @@ def build_incident_text(item: dict) -> str:
         parts.append(f"Url: {url}")
     return " ".join(parts)
 
-with open(INPUT_JSON, "r", encoding="utf-8") as f:
-    data = json.load(f)
-    if not isinstance(data, list):
-        raise ValueError("File JSON phải là một mảng các object.")
-    incidents = [build_incident_text(x) for x in data if isinstance(x, dict)]
+def event_id(item: dict) -> str:
+    """ID ổn định của 1 bài: theo URL (bài được cập nhật giữ nguyên ID), không có URL thì theo content_hash"""
+    key = item.get("url") or item.get("content_hash") or build_incident_text(item)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+def event_fingerprint(item: dict) -> str:
+    """Đổi khi nội dung bài đổi → bài được phân loại lại"""
+    return item.get("content_hash") or hashlib.sha256(build_incident_text(item).encode("utf-8")).hexdigest()
+
+# ====== Checkpoint (chạy lại chỉ gửi bài mới / bài đổi nội dung) ======
+def max_index_in(path: Path) -> int:
+    """Index lớn nhất đã có trong ket_qua.jsonl (để bài mới không trùng index của các lần chạy cũ)"""
+    max_index = 0
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    idx = json.loads(line).get("index")
+                except (json.JSONDecodeError, AttributeError):
+                    continue
+                if isinstance(idx, int):
+                    max_index = max(max_index, idx)
+    except FileNotFoundError:
+        pass
+    return max_index
+
+def load_checkpoint(path: Path) -> Dict:
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        checkpoint.setdefault("index", {})
+        checkpoint.setdefault("done", {})
+        return checkpoint
+    except FileNotFoundError:
+        pass
+    except (json.JSONDecodeError, AttributeError) as e:
+        print(f"[CẢNH BÁO] Checkpoint {path} hỏng ({e}), phân loại lại từ đầu")
+    return {"next_index": max_index_in(OUTPUT_JSONL) + 1, "index": {}, "done": {}}
+
+def save_checkpoint(path: Path, checkpoint: Dict):
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    tmp_path.replace(path)
+
+def select_pending(data: List[dict], checkpoint: Dict, full: bool = False) -> List[Dict]:
+    """
+    Bài cần gửi Gemini: chưa phân loại hoặc nội dung đã đổi (full=True: tất cả).
+    Bài mới được cấp index tăng dần, bài cũ giữ index → ket_qua.jsonl không trùng index giữa các lần chạy.
+    Bỏ bài gần trùng (is_representative=False): chỉ gửi 1 bài đại diện mỗi nhóm.
+    """
+    pending = []
+    for item in data:
+        if not isinstance(item, dict) or item.get("is_representative") is False:
+            continue
+        eid = event_id(item)
+        fingerprint = event_fingerprint(item)
+        if not full and checkpoint["done"].get(eid) == fingerprint:
+            continue
+        if eid not in checkpoint["index"]:
+            checkpoint["index"][eid] = checkpoint["next_index"]
+            checkpoint["next_index"] += 1
+        pending.append({
+            "index": checkpoint["index"][eid],
+            "event_id": eid,
+            "fingerprint": fingerprint,
+            "text": build_incident_text(item),
+        })
+    return pending
 
 # ====== In chuyên nghiệp (tùy chọn dùng rich nếu có) ======
 import sys
@@ -354,116 +588,351 @@ def summarize_and_print(rows: list):
     dropped = c.get("DROP", 0)
     print(f"Tóm tắt: giữ {kept} | loại {dropped}\n")
 
-# ====== Xử lý theo batch 30 sự cố ======
-output_jsonl = DATA_DIR / "ket_qua.jsonl"
-output_jsonl.parent.mkdir(parents=True, exist_ok=True)
-
-batches = chunk_list(incidents, 30)
-global_index_start = 1
-
-for batch_id, batch in enumerate(batches, start=1):
-    batch_indices = list(range(global_index_start, global_index_start + len(batch)))
-    seed_list = [{"index": idx, "noi_dung": txt} for idx, txt in zip(batch_indices, batch)]
-
-    # LƯU Ý: sửa "url: [...]" -> "url": [...] trong schema mẫu để model trả đúng key
-    batch_prompt = f"""{prompt_text}
-
-Hãy phân loại TOÀN BỘ danh sách văn bản sau và TRẢ VỀ DUY NHẤT MỘT MẢNG JSON.
-Mỗi phần tử có dạng:
-{{
-  "index": <int>,
-  "noi_dung": <string>,
-  "valid": <bool>,
-  "linh_vuc": [...],
-  "muc_do_khan_cap": "...",
-  "location": {{"text": "...", "type": "ADMIN | ROAD | LANDMARK | COORDS", "coords": {{"lat": 0.0, "lon": 0.0}}}},
-  "alt_locations": [...],
-  "url": [...],
-  "confidence": <0..1>,
-  "rationale": "...",
-  "discard_reason": ["..."]
-}}
-
-Danh sách sự cố (mảng JSON):
-{json.dumps(seed_list, ensure_ascii=False, indent=2)}
-"""
-
+# ====== Giới hạn quota Gemini ======
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class RateLimiter:
+    """Giới hạn request/phút và token/phút theo cửa sổ trượt 60 giây, dùng chung cho các thread gửi batch"""
+
+    def __init__(self, rpm: int, tpm: int, window: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self.events = deque()      # [thời điểm, token] của từng request trong cửa sổ
+        self.cond = threading.Condition()
+
+    def _prune(self, now: float):
+        while self.events and self.events[0][0] <= now - self.window:
+            self.events.popleft()
+
+    def acquire(self, tokens: int) -> list:
+        """Chờ tới khi gửi được 1 request ~`tokens` token; trả về entry để settle() lại số token thật"""
+        tokens = min(tokens, self.tpm)     # batch lớn hơn cả quota vẫn phải gửi được khi cửa sổ trống
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                used = sum(entry[1] for entry in self.events)
+                if len(self.events) < self.rpm and used + tokens <= self.tpm:
+                    entry = [now, tokens]
+                    self.events.append(entry)
+                    return entry
+                wait = self.events[0][0] + self.window - now if self.events else 0.1
+                self.cond.wait(max(0.05, wait))
+
+    def settle(self, entry: list, actual_tokens: int):
+        """Thay ước lượng bằng số token thật (usage_metadata) sau khi có response"""
+        with self.cond:
+            entry[1] = actual_tokens
+            self.cond.notify_all()
+
+# ====== Xử lý theo batch ======
+def build_batch_prompt(batch: List[Dict]) -> str:
+    """Phần thay đổi theo batch: chỉ seed_list (hướng dẫn nằm trong SYSTEM_INSTRUCTION)"""
+    seed_list = [{"index": item["index"], "noi_dung": item["text"]} for item in batch]
+    return "Danh sách sự cố (mảng JSON):\n" + json.dumps(seed_list, ensure_ascii=False)
+
+# Tên context cache phía Gemini (None → gửi SYSTEM_INSTRUCTION kèm mỗi request)
+context_cache_name: Optional[str] = None
+
+def create_context_cache(ttl: int = CONTEXT_CACHE_TTL) -> Optional[str]:
+    """Tạo context cache chứa SYSTEM_INSTRUCTION; None nếu không tạo được (model/tài khoản không hỗ trợ, prompt quá ngắn...)"""
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=batch_prompt,
-            config=types.GenerateContentConfig(
-                # response_mime_type="application/json",
-                thinking_config=types.ThinkingConfig(thinking_budget=0),
+        cached = client.caches.create(
+            model=GEMINI_MODEL,
+            config=types.CreateCachedContentConfig(
+                display_name=f"safemap-classify-{PROMPT_VERSION}",
+                system_instruction=SYSTEM_INSTRUCTION,
+                ttl=f"{ttl}s",
             ),
         )
+        return cached.name
+    except Exception as e:
+        print(f"[CẢNH BÁO] Không tạo được context cache ({e}) - gửi system instruction kèm từng request.")
+        return None
 
-        raw_text = response.text
-        parsed = clean_and_parse_json(raw_text)
-
-        if not isinstance(parsed, list):
-            debug_path = DATA_DIR / f"debug_batch_{batch_id}.txt" 
-            with debug_path.open("w", encoding="utf-8") as dbg:
-                dbg.write(raw_text)
-            print(f"[CẢNH BÁO] Không parse được JSON cho batch {batch_id}. Đã lưu thô: {debug_path}")
-            global_index_start += len(batch)
-            continue
-
-        by_index = {obj.get("index"): obj for obj in parsed if isinstance(obj, dict)}
-
-        printable_rows = []
-        for idx, txt in zip(batch_indices, batch):
-            obj = by_index.get(
-                idx,
-                {
-                    "index": idx,
-                    "noi_dung": txt,
-                    "valid": False,
-                    "discard_reason": ["MODEL_MISSED"],
-                    "confidence": 0.0,
-                    "rationale": "Model không trả về mục này."
-                }
+def delete_context_cache(name: str):
+    try:
+        client.caches.delete(name=name)
+    except Exception:
+        pass    # hết TTL thì Gemini tự xóa
+
+def generation_config():
+    common = dict(
+        response_mime_type="application/json",
+        response_schema=RESPONSE_SCHEMA,
+        thinking_config=types.ThinkingConfig(thinking_budget=0),
+    )
+    if context_cache_name:
+        return types.GenerateContentConfig(cached_content=context_cache_name, **common)
+    return types.GenerateContentConfig(system_instruction=SYSTEM_INSTRUCTION, **common)
+
+def usage_counts(usage) -> Dict[str, int]:
+    """Token của 1 request từ usage_metadata (thiếu trường → 0)"""
+    return {
+        "requests": 1,
+        "prompt": getattr(usage, "prompt_token_count", None) or 0,
+        "cached": getattr(usage, "cached_content_token_count", None) or 0,
+        "output": getattr(usage, "candidates_token_count", None) or 0,
+    }
+
+def request_batch(batch: List[Dict], limiter: RateLimiter, on_object: Callable[[Dict], None]) -> Tuple[str, Dict[str, int]]:
+    """
+    Chạy trong thread pool: chờ quota, gọi Gemini ở chế độ stream + JSON schema;
+    mỗi object đóng ngoặc xong được đưa ngay cho on_object. Trả về (text thô đã nhận, token usage).
+    Lỗi 429/5xx trước khi có object nào → retry; stream đứt giữa chừng → giữ các object đã nhận.
+    """
+    batch_prompt = build_batch_prompt(batch)
+    # Token phần hướng dẫn vẫn tính vào quota TPM dù được cache
+    estimate = (estimate_tokens(SYSTEM_INSTRUCTION) + estimate_tokens(batch_prompt)
+                + sum(item_output_tokens(item) for item in batch))
+    for attempt in range(MAX_ATTEMPTS):
+        entry = limiter.acquire(estimate)
+        parser = JsonArrayStream()
+        chunks: List[str] = []
+        emitted = 0
+        usage = None
+        try:
+            stream = client.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=batch_prompt,
+                config=generation_config(),
             )
-            obj.setdefault("noi_dung", txt)
-
-            # Ghi JSONL
-            save_jsonl(output_jsonl, obj)
+            for chunk in stream:
+                text = chunk.text or ""
+                chunks.append(text)
+                for obj in parser.feed(text):
+                    emitted += 1
+                    on_object(obj)
+                usage = getattr(chunk, "usage_metadata", None) or usage
+        except Exception as e:
+            if emitted:
+                print(f"[CẢNH BÁO] Stream bị ngắt sau {emitted}/{len(batch)} mục: {e}")
+            elif getattr(e, "code", None) not in RETRYABLE_CODES or attempt + 1 == MAX_ATTEMPTS:
+                raise
+            else:
+                time.sleep(2 ** attempt * 5)
+                continue
+        if getattr(usage, "total_token_count", None):
+            limiter.settle(entry, usage.total_token_count)
+        return "".join(chunks), usage_counts(usage)
+
+def cache_key(item: Dict) -> str:
+    return LLMCache.make_key(GEMINI_MODEL, PROMPT_VERSION, item["text"])
+
+class ResultWriter:
+    """Ghi từng kết quả vào ket_qua.jsonl + checkpoint ngay khi có, dùng chung cho các thread"""
+
+    def __init__(self, path: Path, checkpoint: Dict, cache: Optional[LLMCache]):
+        self.path = path
+        self.checkpoint = checkpoint
+        self.cache = cache
+        self.lock = threading.Lock()
+
+    def emit(self, item: Dict, obj: Dict, from_cache: bool = False):
+        if self.cache is not None and not from_cache:
+            self.cache.put(cache_key(item), dict(obj))
+        obj["index"] = item["index"]
+        obj.setdefault("noi_dung", item["text"])
+        obj["event_id"] = item["event_id"]
+        with self.lock:
+            save_jsonl(self.path, obj)
+            self.checkpoint["done"][item["event_id"]] = item["fingerprint"]
+
+    def save_checkpoint(self):
+        with self.lock:
+            save_checkpoint(CHECKPOINT_FILE, self.checkpoint)
+
+def classify_items(batch: List[Dict], limiter: RateLimiter, writer: ResultWriter) -> Tuple[Dict[int, Dict], List[str], Counter]:
+    """
+    Chạy trong thread pool: phân loại batch, gửi lại riêng các bài model bỏ sót.
+    - Bài đã có trong cache → lấy luôn, không gửi
+    - Trả về thiếu một phần → gửi lại đúng các bài còn thiếu
+    - Không parse được / không có bài nào → chia đôi rồi gửi từng nửa (1 bài vẫn lỗi thì bỏ qua)
+    Mỗi kết quả được ghi ngay qua writer; trả về ({index: object}, [text thô không parse được], token usage cộng dồn)
+    """
+    results: Dict[int, Dict] = {}
+    bad_responses: List[str] = []
+    usage: Counter = Counter()
+    by_index = {item["index"]: item for item in batch}
+    if writer.cache is not None:
+        for item in batch:
+            cached = writer.cache.get(cache_key(item))
+            if cached is not None:
+                results[item["index"]] = obj = dict(cached)
+                writer.emit(item, obj, from_cache=True)
+        batch = [item for item in batch if item["index"] not in results]
+
+    def accept(obj):
+        idx = obj.get("index") if isinstance(obj, dict) else None
+        if idx in wanted and idx not in results:
+            results[idx] = obj
+            writer.emit(by_index[idx], obj)
+
+    queue = [batch] if batch else []
+    while queue:
+        part = queue.pop()
+        wanted = {item["index"] for item in part}
+        found_before = len(results)
+        try:
+            raw_text, request_usage = request_batch(part, limiter, accept)
+            usage.update(request_usage)
+        except Exception as e:
+            # Lỗi mạng/quota đã retry trong request_batch; chia nhỏ không giúp được gì
+            print(f"[LỖI] Gửi {len(part)} bài thất bại: {e}")
+            continue
 
-            # Chuẩn hóa URL để in
-            url_val = obj.get("url", "-")
-            if isinstance(url_val, list):
-                url_str = "; ".join(str(u) for u in url_val)
-            elif isinstance(url_val, str):
-                url_str = url_val
+        if len(results) == found_before:
+            # Stream không ra object nào (model bỏ qua schema?) → thử parse cả khối
+            parsed = clean_and_parse_json(raw_text)
+            if isinstance(parsed, list) and parsed:
+                for obj in parsed:
+                    accept(obj)
             else:
-                url_str = "-"
-
-            # Hàng in
-            valid = obj.get("valid") is True
-            status = "OK" if valid else "DROP"
-            linh_vuc = ", ".join(obj.get("linh_vuc", [])) if valid else "-"
-            muc_do = obj.get("muc_do_khan_cap") if valid else "-"
-            loc_text = (obj.get("location") or {}).get("text") if valid else "-"
-            discard = ", ".join(obj.get("discard_reason", [])) if not valid else ""
-            conf = obj.get("confidence", "-")
-
-            printable_rows.append({
-                "index": idx,
-                "status": status,
-                "linh_vuc": linh_vuc or "-",
-                "muc_do": muc_do or "-",
-                "location": loc_text or "-",
-                "discard": discard or "",
-                "confidence": conf,
-                "url": url_str or "-",
-            })
-
-        print_batch_table(batch_id, len(batches), printable_rows)
-        summarize_and_print(printable_rows)
+                bad_responses.append(raw_text)
 
-        global_index_start += len(batch)
+        missing = [item for item in part if item["index"] not in results]
+        if not missing:
+            continue
+        if len(missing) < len(part):
+            queue.append(missing)
+        elif len(part) > 1:
+            mid = len(part) // 2
+            queue.extend([part[mid:], part[:mid]])
+    return results, bad_responses, usage
+
+def format_usage(usage: Counter) -> str:
+    return (f"{usage['requests']} request | vào {usage['prompt']} token (cache {usage['cached']}) "
+            f"| ra {usage['output']} token")
+
+def report_batch(batch_id: int, total_batches: int, batch: List[Dict],
+                 results: Dict[int, Dict], bad_responses: List[str], usage: Counter, writer: ResultWriter) -> bool:
+    """Chạy ở thread chính khi batch xong: lưu checkpoint, in bảng; False nếu còn bài chưa phân loại"""
+    if bad_responses:
+        debug_path = DATA_DIR / f"debug_batch_{batch_id}.txt" 
+        with debug_path.open("w", encoding="utf-8") as dbg:
+            dbg.write("\n\n===== RESPONSE =====\n\n".join(bad_responses))
+        print(f"[CẢNH BÁO] {len(bad_responses)} response không parse được ở batch {batch_id}. Đã lưu thô: {debug_path}")
+
+    printable_rows = []
+    missed = []
+    for item in batch:
+        idx = item["index"]
+        obj = results.get(idx)
+        if obj is None:
+            # Không ghi placeholder: bài không vào checkpoint → lần chạy sau gửi lại
+            missed.append(idx)
+            continue
 
-    except Exception as e:
-        print(f"[LỖI] Batch {batch_id}: {e}")
+        # Chuẩn hóa URL để in
+        url_val = obj.get("url", "-")
+        if isinstance(url_val, list):
+            url_str = "; ".join(str(u) for u in url_val)
+        elif isinstance(url_val, str):
+            url_str = url_val
+        else:
+            url_str = "-"
+
+        # Hàng in
+        valid = obj.get("valid") is True
+        status = "OK" if valid else "DROP"
+        linh_vuc = ", ".join(obj.get("linh_vuc", [])) if valid else "-"
+        muc_do = obj.get("muc_do_khan_cap") if valid else "-"
+        loc_text = (obj.get("location") or {}).get("text") if valid else "-"
+        discard = ", ".join(obj.get("discard_reason", [])) if not valid else ""
+        conf = obj.get("confidence", "-")
+
+        printable_rows.append({
+            "index": idx,
+            "status": status,
+            "linh_vuc": linh_vuc or "-",
+            "muc_do": muc_do or "-",
+            "location": loc_text or "-",
+            "discard": discard or "",
+            "confidence": conf,
+            "url": url_str or "-",
+        })
+
+    writer.save_checkpoint()
+    if printable_rows:
+        print_batch_table(batch_id, total_batches, printable_rows)
+        summarize_and_print(printable_rows)
+    if usage["requests"]:
+        print(f"Token batch {batch_id}: {format_usage(usage)}")
+    if missed:
+        print(f"[CẢNH BÁO] Batch {batch_id}: {len(missed)} bài chưa phân loại được (index {missed}) - sẽ gửi lại lần chạy sau.")
+    return not missed
 
-print(f"Hoàn tất. File kết quả (JSON Lines): {output_jsonl}")
+def run_batches(batches: List[List[Dict]], writer: ResultWriter, concurrency: int, limiter: RateLimiter) -> int:
+    """
+    Gửi các batch song song (tối đa `concurrency`, trong quota của limiter).
+    Kết quả vào ket_qua.jsonl ngay khi từng object stream về (thứ tự theo lúc hoàn thành,
+    ket_qua.py sắp lại theo index); bảng in theo batch khi batch xong. Trả về số batch lỗi.
+    """
+    failed = 0
+    total_usage: Counter = Counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(classify_items, batch, limiter, writer): batch_id for batch_id, batch in enumerate(batches, start=1)}
+        for future in as_completed(futures):
+            batch_id = futures[future]
+            try:
+                results, bad_responses, usage = future.result()
+            except Exception as e:
+                print(f"[LỖI] Batch {batch_id}: {e}")
+                results, bad_responses, usage = {}, [], Counter()
+            total_usage.update(usage)
+            if not report_batch(batch_id, len(batches), batches[batch_id - 1], results, bad_responses, usage, writer):
+                failed += 1
+    if total_usage["requests"]:
+        print(f"Tổng token: {format_usage(total_usage)}")
+    return failed
+
+def main():
+    global context_cache_name
+    ap = argparse.ArgumentParser(description="Phân loại sự cố bằng Gemini → Data/ket_qua.jsonl")
+    ap.add_argument("--full", action="store_true",
+                    help="Bỏ qua checkpoint, gửi lại toàn bộ bài (vẫn giữ index cũ)")
+    ap.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_BATCHES, help="Số batch gửi song song")
+    ap.add_argument("--rpm", type=int, default=RPM_LIMIT, help="Quota request/phút của model")
+    ap.add_argument("--tpm", type=int, default=TPM_LIMIT, help="Quota token/phút của model")
+    ap.add_argument("--no-cache", action="store_true", help="Không dùng cache LLM, gọi Gemini cho mọi bài")
+    ap.add_argument("--context-cache", action="store_true",
+                    help="Tạo context cache phía Gemini cho phần hướng dẫn (mặc định gửi system instruction mỗi request)")
+    args = ap.parse_args()
+
+    OUTPUT_JSONL.parent.mkdir(parents=True, exist_ok=True)
+
+    # Kho event append-only của crawler (Data/events), fallback về INPUT_JSON cũ
+    data = load_events(DATA_DIR, legacy_file=INPUT_JSON)
+    checkpoint = load_checkpoint(CHECKPOINT_FILE)
+    pending = select_pending(data, checkpoint, full=args.full)
+    save_checkpoint(CHECKPOINT_FILE, checkpoint)   # lưu index vừa cấp ngay, để index ổn định dù batch lỗi
+
+    print(f"{len(pending)} bài cần phân loại ({len(checkpoint['done'])} bài đã có trong checkpoint)")
+    if not pending:
+        print("Không có bài mới.")
+        return
+
+    batches = make_batches(pending)
+    limiter = RateLimiter(args.rpm, args.tpm)
+    cache = None if args.no_cache else LLMCache(LLM_CACHE_FILE)
+    writer = ResultWriter(OUTPUT_JSONL, checkpoint, cache)
+    if args.context_cache:
+        context_cache_name = create_context_cache()
+    try:
+        failed = run_batches(batches, writer, max(1, args.concurrency), limiter)
+    finally:
+        if context_cache_name:
+            delete_context_cache(context_cache_name)
+            context_cache_name = None
+
+    if failed:
+        print(f"{failed}/{len(batches)} batch còn bài chưa phân loại - chạy lại để gửi lại các bài đó.")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"LLM cache: {stats['hits']} hit / {stats['misses']} miss ({stats['entries']} mục)")
+    print(f"Hoàn tất. File kết quả (JSON Lines): {OUTPUT_JSONL}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+bench_crawl.py
+Benchmark crawler offline: replay RSS + trang bài từ server HTTP local, không phụ thuộc trang báo thật.
+
+- Fixture: HTML đã cache ở Data/html_cache (xem crawl.py --no-html-cache), tối đa --pages trang mỗi host;
+  không có cache (hoặc --synthetic N) thì sinh trang giả theo EXTRACTION_PLANS của từng trang.
+  RSS của mỗi nguồn được dựng từ danh sách trang fixture (pubDate = hiện tại).
+- Mỗi host thật có 1 server local riêng (127.0.0.1:port), crawl.HOST_ALIASES map port → host thật
+  để plan / token bucket / circuit breaker giống khi chạy thật.
+- Server giả lập độ trễ (--latency-ms, dao động ±50%, --tail-rate request chậm gấp 10) và lỗi (--error-rate → 503).
+- Kịch bản:
+    rss      crawl_rss_feed cho từng nguồn
+    extract  extract_article_content trên HTML có sẵn (không mạng), so sánh plan / generic selector
+    process  Phase 2 (process_articles_parallel, hoặc --engines async,pipeline) với từng số worker trong --workers
+- Báo cáo: số item, item/giây, p50/p99 độ trễ (ms), ru_maxrss; peak memory theo tracemalloc khi có --tracemalloc
+  (chỉ process chính, và làm mọi thứ chậm đi nhiều lần - đừng so item/giây giữa lần có và không có cờ này).
+
+Ví dụ:
+    python bench_crawl.py
+    python bench_crawl.py --synthetic 40 --workers 4,8,16,32 --latency-ms 80 --error-rate 0.02
+    python bench_crawl.py --scenarios process --engines thread,async,pipeline --json bench.json
+"""
+
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from xml.sax.saxutils import escape
+import argparse
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:     # Windows
+    RESOURCE_AVAILABLE = False
+
+import crawl
+from crawl_metrics import percentile
+
+# ====== FIXTURES ======
+SYNTHETIC_SENTENCES = [
+    "Vụ cháy xảy ra tại một căn nhà trên phố Kim Mã, quận Ba Đình, Hà Nội vào rạng sáng nay",
+    "Lực lượng cảnh sát phòng cháy chữa cháy đã có mặt sau ít phút và khống chế đám cháy",
+    "Theo thông tin ban đầu, vụ việc không gây thương vong nhưng thiệt hại về tài sản khá lớn",
+    "Mưa lớn kéo dài khiến nhiều tuyến đường tại quận Cầu Giấy bị ngập sâu, giao thông ùn tắc",
+    "Người dân cho biết nước rút chậm, nhiều phương tiện chết máy giữa đường",
+    "Vụ va chạm giữa xe tải và xe máy trên đường vành đai 3 khiến một người bị thương",
+    "Công an quận đang điều tra làm rõ nguyên nhân và xử lý theo quy định của pháp luật",
+    "Chính quyền địa phương khuyến cáo người dân hạn chế ra đường trong thời gian mưa bão",
+    "Giá nông sản tại chợ đầu mối tăng nhẹ so với tuần trước do nguồn cung giảm",
+    "Đội tuyển bóng đá đã có buổi tập đầu tiên chuẩn bị cho trận đấu vòng loại sắp tới",
+]
+
+SIMPLE_SELECTOR_PATTERN = re.compile(r'(\w+)(?:([.#])([\w-]+))?')
+
+def element_for(selector: str) -> Tuple[str, str]:
+    """'h1.title-detail' → ('<h1 class="title-detail">', '</h1>')"""
+    tag, kind, value = SIMPLE_SELECTOR_PATTERN.fullmatch(selector).groups()
+    attr = {'.': f' class="{value}"', '#': f' id="{value}"'}.get(kind, '')
+    return f'<{tag}{attr}>', f'</{tag}>'
+
+def synthetic_page(host: str, index: int, rng: random.Random) -> Tuple[str, bytes]:
+    """Trang giả cỡ trang thật (~100KB): menu, body theo plan của host, tin liên quan, script, footer"""
+    plan = crawl.EXTRACTION_PLANS.get(host, {"title": "h1", "content": ["article"]})
+    title = f"Bản tin {index}: {rng.choice(SYNTHETIC_SENTENCES)[:60]}"
+    title_open, title_close = element_for(plan['title'])
+    body_open, body_close = element_for(plan['content'][0])
+    paragraphs = ''.join(
+        f"<p>{'. '.join(rng.sample(SYNTHETIC_SENTENCES, 3))}.</p>" for _ in range(rng.randint(8, 16))
+    )
+    nav = ''.join(f'<li><a href="/muc-{i}">Chuyên mục {i}</a></li>' for i in range(150))
+    related = ''.join(f'<div class="related"><p>{rng.choice(SYNTHETIC_SENTENCES)}</p></div>' for _ in range(40))
+    script = "<script>var tracking = '" + "x" * 30000 + "';</script>"
+    footer = '<footer>' + ''.join(f'<p>Liên hệ quảng cáo {i}</p>' for i in range(100)) + '</footer>'
+    html = (
+        f"<!DOCTYPE html><html><head><title>{title}</title>"
+        f'<meta property="article:published_time" content="{time.strftime("%Y-%m-%dT%H:%M:%S")}"></head>'
+        f"<body><ul class=\"menu\">{nav}</ul>{title_open}{title}{title_close}"
+        f"{body_open}{paragraphs}{body_close}{related}{script}{footer}</body></html>"
+    )
+    return title, html.encode('utf-8')
+
+def load_fixtures(pages_per_host: int, synthetic: Optional[int], rng: random.Random) -> Dict[str, Dict[str, Tuple[str, bytes]]]:
+    """{host thật: {path: (title, html)}} cho mọi nguồn trong SOURCES"""
+    fixtures: Dict[str, Dict[str, Tuple[str, bytes]]] = {}
+    hosts = [crawl.get_host(config['base_url']) for config in crawl.SOURCES.values()]
+
+    if not synthetic:
+        for entry in crawl.iter_html_cache():
+            host = crawl.get_host(entry['url'])
+            # Trang truncated chỉ có tới hết container → không phải trang thật để replay
+            if host not in hosts or entry.get('truncated') or len(fixtures.get(host, ())) >= pages_per_host:
+                continue
+            try:
+                html = crawl.load_cached_html(entry['sha256'])
+            except OSError:
+                continue
+            path = urlsplit(entry['url']).path or '/'
+            fixtures.setdefault(host, {})[path] = (path.strip('/'), html)
+
+    for host in hosts:
+        if fixtures.get(host):
+            continue
+        pages = fixtures[host] = {}
+        for i in range(synthetic or pages_per_host):
+            title, html = synthetic_page(host, i, rng)
+            pages[f"/bai-{i}.html"] = (title, html)
+    return fixtures
+
+def build_rss(base_url: str, pages: Dict[str, Tuple[str, bytes]]) -> bytes:
+    now = formatdate(localtime=False)
+    items = ''.join(
+        f"<item><title>{escape(title)}</title><link>{base_url}{path}</link>"
+        f"<guid>{base_url}{path}</guid><pubDate>{now}</pubDate></item>"
+        for path, (title, _) in pages.items()
+    )
+    return (f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+            f'<title>bench</title>{items}</channel></rss>').encode('utf-8')
+
+# ====== REPLAY SERVER ======
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Client ngừng đọc sớm (ContainerWatcher) hoặc đóng keep-alive - bình thường khi benchmark
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+class ReplayServer:
+    """1 ThreadingHTTPServer local cho mỗi host thật, trả fixture với độ trễ / lỗi giả lập"""
+
+    def __init__(self, fixtures: Dict[str, Dict[str, Tuple[str, bytes]]], latency_ms: float = 50,
+                 error_rate: float = 0.0, tail_rate: float = 0.01):
+        self.fixtures = fixtures
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.tail_rate = tail_rate
+        self.servers: List[QuietHTTPServer] = []
+        self.base_urls: Dict[str, str] = {}
+        self.feeds: Dict[str, bytes] = {}
+
+    def delay(self) -> float:
+        delay = self.latency * random.uniform(0.5, 1.5)
+        if random.random() < self.tail_rate:
+            delay *= 10
+        return delay
+
+    def make_handler(self, host: str):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                time.sleep(server.delay())
+                if random.random() < server.error_rate:
+                    self.send_error(503)
+                    return
+                if self.path == "/rss":
+                    body, content_type = server.feeds[host], "application/rss+xml; charset=utf-8"
+                elif self.path in server.fixtures[host]:
+                    body, content_type = server.fixtures[host][self.path][1], "text/html; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        for host in self.fixtures:
+            httpd = QuietHTTPServer(("127.0.0.1", 0), self.make_handler(host))
+            netloc = f"127.0.0.1:{httpd.server_port}"
+            crawl.HOST_ALIASES[netloc] = host
+            self.base_urls[host] = f"http://{netloc}"
+            self.feeds[host] = build_rss(self.base_urls[host], self.fixtures[host])
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+            self.servers.append(httpd)
+        return self
+
+    def stop(self):
+        for httpd in self.servers:
+            httpd.shutdown()
+            httpd.server_close()
+
+    def articles(self) -> List[Dict]:
+        return [
+            {'url': self.base_urls[host] + path, 'title': title, 'source': crawl.HOST_SOURCES.get(host, host)}
+            for host, pages in self.fixtures.items()
+            for path, (title, _) in pages.items()
+        ]
+
+# ====== ĐO ======
+def reset_crawler_state(host_rate: float):
+    """Mỗi lần đo bắt đầu như nhau: metrics, token bucket, circuit breaker, frontier rỗng"""
+    crawl.METRICS.reset()
+    crawl._host_buckets.clear()
+    crawl._host_breakers.clear()
+    crawl._seen_urls.clear()
+    crawl._feed_cache.clear()
+    if host_rate > 0:
+        for host in list(crawl.HOST_RATES):
+            crawl.HOST_RATES[host] = (host_rate, host_rate)
+
+def metric_samples(name: str) -> List[float]:
+    with crawl.METRICS.lock:
+        return sorted(v for (metric, _), values in crawl.METRICS.samples.items() if metric == name for v in values)
+
+def max_rss_mb() -> float:
+    if not RESOURCE_AVAILABLE:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+@contextmanager
+def measure(trace_memory: bool):
+    """Đo thời gian + peak memory; người gọi điền 'items' và 'latencies' vào dict trả về"""
+    result = {"items": 0, "latencies": []}
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        yield result
+    finally:
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        if trace_memory:
+            tracemalloc.stop()
+        latencies = sorted(result.pop("latencies"))
+        result.update({
+            "seconds": round(seconds, 3),
+            "items_per_sec": round(result["items"] / seconds, 2) if seconds else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "peak_mb": round(peak / (1024 * 1024), 1),
+            "maxrss_mb": round(max_rss_mb(), 1),
+        })
+
+def bench_rss(server: ReplayServer, args) -> Dict:
+    reset_crawler_state(args.host_rate)
+    with measure(args.tracemalloc) as result:
+        for host, base_url in server.base_urls.items():
+            source = crawl.HOST_SOURCES.get(host, host)
+            result["items"] += len(crawl.crawl_rss_feed(source, [base_url + "/rss"], limit=10000, use_cache=False))
+        result["latencies"] = metric_samples("feed_fetch_seconds")
+    result.update(scenario="rss", engine="-", workers=len(server.base_urls))
+    return result
+
+def bench_extract(fixtures: Dict[str, Dict[str, Tuple[str, bytes]]], strategy: str, args) -> Dict:
+    """Chỉ parse (không mạng): plan = selector riêng của host, generic = cascade CONTENT_SELECTORS"""
+    reset_crawler_state(args.host_rate)
+    saved_plans = crawl._compiled_plans
+    if strategy == "generic":
+        crawl._compiled_plans = {}
+    try:
+        with measure(args.tracemalloc) as result:
+            for host, pages in fixtures.items():
+                for path, (_, html) in pages.items():
+                    started = time.perf_counter()
+                    content = crawl.extract_article_content(f"https://{host}{path}", html)
+                    result["latencies"].append(time.perf_counter() - started)
+                    result["items"] += 1
+                    result["extracted"] = result.get("extracted", 0) + (content is not None)
+    finally:
+        crawl._compiled_plans = saved_plans
+    result.update(scenario="extract", engine=strategy, workers=1)
+    return result
+
+def bench_process(server: ReplayServer, engine: str, workers: int, args) -> Dict:
+    reset_crawler_state(args.host_rate)
+    articles = server.articles()
+    with measure(args.tracemalloc) as result:
+        if engine == "async":
+            events = crawl.process_articles_async(articles, set(), max_inflight=workers * len(server.base_urls),
+                                                  per_host=workers, parse_workers=workers)
+        elif engine == "pipeline":
+            events = crawl.process_articles_pipeline(articles, set(), io_workers=workers)
+        else:
+            events = crawl.process_articles_parallel(articles, set(), max_workers=workers)
+        result["items"] = len(articles)
+        result["events"] = len(events)
+        result["latencies"] = metric_samples("article_fetch_seconds")
+    result.update(scenario="process", engine=engine, workers=workers)
+    return result
+
+# ====== BÁO CÁO ======
+COLUMNS = [
+    ("scenario", 8), ("engine", 9), ("workers", 7), ("items", 6), ("seconds", 8),
+    ("items_per_sec", 13), ("p50_ms", 8), ("p99_ms", 8), ("peak_mb", 8), ("maxrss_mb", 9),
+]
+
+def print_table(results: List[Dict]):
+    print(" ".join(name.rjust(width) for name, width in COLUMNS))
+    for row in results:
+        print(" ".join(str(row.get(name, "")).rjust(width) for name, width in COLUMNS))
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Benchmark crawler offline với server replay local")
+    ap.add_argument("--scenarios", default="rss,extract,process", help="Các kịch bản, cách nhau bởi dấu phẩy")
+    ap.add_argument("--engines", default="thread", help="Engine Phase 2 cho kịch bản process: thread,async,pipeline")
+    ap.add_argument("--workers", default="4,8,16", help="Danh sách số worker cần so sánh")
+    ap.add_argument("--strategies", default="plan,generic", help="Kịch bản extract: plan,generic")
+    ap.add_argument("--pages", type=int, default=20, help="Số trang fixture tối đa mỗi host (từ HTML cache)")
+    ap.add_argument("--synthetic", type=int, default=None, help="Bỏ qua HTML cache, sinh N trang giả mỗi host")
+    ap.add_argument("--latency-ms", type=float, default=50, help="Độ trễ trung bình mỗi response của server (ms)")
+    ap.add_argument("--tail-rate", type=float, default=0.01, help="Tỉ lệ request chậm gấp 10 lần")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Tỉ lệ request trả 503")
+    ap.add_argument("--host-rate", type=float, default=1000,
+                    help="Token bucket mỗi host (req/s) khi đo; 0 = giữ politeness của SOURCES")
+    ap.add_argument("--repeat", type=int, default=1, help="Số lần lặp mỗi cấu hình")
+    ap.add_argument("--seed", type=int, default=42, help="Seed cho fixture / độ trễ / lỗi giả lập")
+    ap.add_argument("--tracemalloc", action="store_true",
+                    help="Đo peak memory bằng tracemalloc (chậm hơn nhiều lần, chỉ so memory giữa các cấu hình)")
+    ap.add_argument("--json", default=None, help="Ghi kết quả ra file JSON")
+    return ap.parse_args()
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    scenarios = set(args.scenarios.split(","))
+
+    # Benchmark đo crawler, không đo ghi log / ghi cache
+    crawl.logger.setLevel(logging.ERROR)
+    crawl.HTML_CACHE_ENABLED = False
+
+    fixtures = load_fixtures(args.pages, args.synthetic, rng)
+    total_pages = sum(len(pages) for pages in fixtures.values())
+    total_bytes = sum(len(html) for pages in fixtures.values() for _, html in pages.values())
+    print(f"Fixtures: {total_pages} pages / {len(fixtures)} hosts ({total_bytes / 1024 / 1024:.1f} MB)")
+
+    server = ReplayServer(fixtures, args.latency_ms, args.error_rate, args.tail_rate).start()
+    results = []
+    try:
+        for _ in range(args.repeat):
+            if "rss" in scenarios:
+                results.append(bench_rss(server, args))
+            if "extract" in scenarios:
+                for strategy in args.strategies.split(","):
+                    results.append(bench_extract(fixtures, strategy, args))
+            if "process" in scenarios:
+                for engine in args.engines.split(","):
+                    for workers in (int(w) for w in args.workers.split(",")):
+                        results.append(bench_process(server, engine, workers, args))
+    finally:
+        server.stop()
+
+    print()
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "config": vars(args),
+                "fixtures": {"pages": total_pages, "hosts": len(fixtures), "bytes": total_bytes},
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n✓ Saved to {args.json}")
+
+if __name__ == "__main__":
+    main()
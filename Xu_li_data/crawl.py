@@ -8,6 +8,8 @@ FIXED: Better RSS crawling with debug info and fallback URLs
 """
 from pathlib import Path
 import os
+import argparse
+import asyncio
 import feedparser
 import requests
 import json
@@ -16,11 +18,34 @@ import time
 import random
 import logging
 import hashlib
+import gzip
+import calendar
+import signal
+from email.utils import parsedate_to_datetime
 from bs4 import BeautifulSoup
-from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import soupsieve as sv
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse, urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 import threading
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple, NamedTuple, Callable, Container
+from event_store import EventStore
+from near_dup import NearDupIndex, simhash
+from crawl_metrics import CrawlMetrics
+from llm_cache import LLMCache
+
+# Thư mục dự án (SAFEMAP)
+PROJECT_ROOT = Path(__file__).resolve().parents[1]   # ../ từ Xu_li_data
+
+# Thư mục Data và các file đích
+DATA_DIR = PROJECT_ROOT / "Data"
+FEED_CACHE_FILE = DATA_DIR / "feed_cache.json"   # ETag / Last-Modified / bài chờ tải của từng RSS
+URL_FRONTIER_FILE = DATA_DIR / "url_frontier.json"   # URL bài đã tải: {canonical_url: timestamp}
+EVENTS_DIR = DATA_DIR / "events"   # kho event append-only (xem event_store.py)
+LEGACY_OUTPUT_FILE = DATA_DIR / "safemap_data.json"   # định dạng mảng cũ, chỉ ghi khi --export-json
+HTML_CACHE_DIR = DATA_DIR / "html_cache"   # HTML thô (gzip, theo sha256) + index.jsonl (url, thời điểm tải)
+LLM_CACHE_FILE = DATA_DIR / "llm_cache.jsonl"   # kết quả extract_with_llm theo (model, prompt, content_hash)
+METRICS_DIR = DATA_DIR / "metrics"   # crawl_metrics.json + crawl.prom của lần chạy gần nhất
 
 # Setup logging - chỉ ghi vào file, không hiện terminal
 logging.basicConfig(
@@ -64,6 +89,26 @@ if OPENAI_API_KEY and OPENAI_API_KEY != "":
 else:
     logger.info("ℹ OpenAI API not configured - using enhanced rule-based extraction")
 
+# LLM stage: chạy riêng với fetch worker, giới hạn request/giây, cache theo content_hash
+LLM_MODEL = "gpt-4o-mini"
+LLM_PROMPT_VERSION = "v1"     # tăng khi sửa prompt trong extract_with_llm → không dùng lại cache cũ
+LLM_WORKERS = 4
+LLM_RATE = 2.0                # request/giây
+
+# Async fetch engine (optional) - cần aiohttp
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# Batch summarizer (optional) - cần numpy
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 # News sources - UPDATED with working RSS URLs (verified)
 SOURCES = {
     "VnExpress": {
@@ -72,7 +117,9 @@ SOURCES = {
             "https://vnexpress.net/rss/thoi-su.rss",
             "https://vnexpress.net/rss/xa-hoi.rss"
         ],
-        "base_url": "https://vnexpress.net"
+        "base_url": "https://vnexpress.net",
+        "rate": 2.0,    # request/giây tới host này
+        "burst": 4
     },
     "Dân Trí": {
         "rss": [
@@ -80,14 +127,18 @@ SOURCES = {
             "https://dantri.com.vn/rss/thoi-su.rss",
             "https://dantri.com.vn/rss/su-kien.rss"
         ],
-        "base_url": "https://dantri.com.vn"
+        "base_url": "https://dantri.com.vn",
+        "rate": 2.0,    # request/giây tới host này
+        "burst": 4
     },
     "Vietnamnet": {
         "rss": [
             "https://vietnamnet.vn/rss/thoi-su.rss",
             "https://vietnamnet.vn/rss/xa-hoi.rss"
         ],
-        "base_url": "https://vietnamnet.vn"
+        "base_url": "https://vietnamnet.vn",
+        "rate": 2.0,    # request/giây tới host này
+        "burst": 4
     },
     "Tuổi Trẻ": {
         "rss": [
@@ -95,26 +146,83 @@ SOURCES = {
             "https://tuoitre.vn/rss/thoi-su.rss",
             "https://tuoitre.vn/rss/xa-hoi.rss"
         ],
-        "base_url": "https://tuoitre.vn"
+        "base_url": "https://tuoitre.vn",
+        "rate": 2.0,    # request/giây tới host này
+        "burst": 4
     },
     "Thanh Niên": {
         "rss": [
             "https://thanhnien.vn/rss/home.rss",
             "https://thanhnien.vn/rss/thoi-su.rss"
         ],
-        "base_url": "https://thanhnien.vn"
+        "base_url": "https://thanhnien.vn",
+        "rate": 2.0,    # request/giây tới host này
+        "burst": 4
     }
 }
 
-# Hanoi locations
+# Politeness mặc định cho host không có trong SOURCES
+DEFAULT_HOST_RATE = 1.0
+DEFAULT_HOST_BURST = 2
+
+# Retry + circuit breaker theo host: lỗi tạm thời (timeout, 5xx, 408, 429) mới retry,
+# BREAKER_THRESHOLD lỗi liên tiếp → ngắt host, mọi request tới host đó fail ngay trong thời gian nghỉ
+FETCH_ATTEMPTS = 3
+CONNECT_TIMEOUT = 5          # giây, host chết không giữ worker tới hết read timeout
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 8.0
+MAX_RETRY_AFTER = 10         # Retry-After dài hơn → không chờ, ngắt host theo Retry-After
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+BREAKER_MAX_COOLDOWN = 600.0
+RETRYABLE_STATUSES = {408, 429}
+
+# --daemon: mỗi feed có chu kỳ poll riêng (giây), lưu trong feed_cache.json.
+# Có bài mới → chu kỳ giảm một nửa, không có → tăng 1.5 lần, luôn trong [min, max]
+POLL_DEFAULT_INTERVAL = 300
+POLL_MIN_INTERVAL = 60
+POLL_MAX_INTERVAL = 1800
+POLL_SHRINK = 0.5
+POLL_GROW = 1.5
+
+# Hanoi locations (12 quận, thị xã Sơn Tây và 17 huyện ngoại thành)
 HANOI_DISTRICTS = [
     "Ba Đình", "Hoàn Kiếm", "Hai Bà Trưng", "Đống Đa",
     "Tây Hồ", "Cầu Giấy", "Thanh Xuân", "Hoàng Mai",
-    "Long Biên", "Bắc Từ Liêm", "Nam Từ Liêm", "Hà Đông"
+    "Long Biên", "Bắc Từ Liêm", "Nam Từ Liêm", "Hà Đông",
+    "Sơn Tây", "Ba Vì", "Chương Mỹ", "Đan Phượng", "Đông Anh", "Gia Lâm",
+    "Hoài Đức", "Mê Linh", "Mỹ Đức", "Phú Xuyên", "Phúc Thọ", "Quốc Oai",
+    "Sóc Sơn", "Thạch Thất", "Thanh Oai", "Thanh Trì", "Thường Tín", "Ứng Hòa"
 ]
 
 HANOI_KEYWORDS = ["Hà Nội", "Ha Noi", "Thủ đô", "TP Hà Nội"]
 
+# Pre-filter trên RSS (title/summary/category) trước khi tải bài:
+# bài không nhắc Hà Nội mà nêu tỉnh/thành khác (và không có từ khóa sự cố),
+# hoặc thuộc chuyên mục ngoài phạm vi → bỏ qua không tải.
+# Không đưa tên dễ nhầm với từ thường / tên phố Hà Nội (Huế, Hòa Bình, Thái Bình, Bình Định)
+OTHER_PROVINCES = [
+    "TP HCM", "TP.HCM", "TPHCM", "Sài Gòn", "Đà Nẵng", "Hải Phòng", "Cần Thơ",
+    "Nghệ An", "Thanh Hóa", "Quảng Ninh", "Khánh Hòa", "Nha Trang", "Bình Dương", "Đồng Nai",
+    "Lâm Đồng", "Đà Lạt", "Đắk Lắk", "Gia Lai", "Quảng Nam", "Quảng Ngãi",
+    "Hà Tĩnh", "Quảng Bình", "Quảng Trị", "Lào Cai", "Yên Bái", "Sơn La", "Điện Biên",
+    "Cao Bằng", "Lạng Sơn", "Thái Nguyên", "Bắc Ninh", "Bắc Giang", "Hải Dương", "Hưng Yên",
+    "Nam Định", "Ninh Bình", "Hà Nam", "Vĩnh Phúc", "Phú Thọ", "Tuyên Quang",
+    "Hà Giang", "An Giang", "Kiên Giang", "Phú Quốc", "Cà Mau", "Bạc Liêu",
+    "Sóc Trăng", "Vĩnh Long", "Tiền Giang", "Bến Tre", "Long An", "Tây Ninh", "Bình Phước",
+    "Vũng Tàu", "Phú Yên", "Kon Tum", "Đắk Nông", "Ninh Thuận", "Bình Thuận", "Trà Vinh",
+    "Đồng Tháp", "Hậu Giang", "Lai Châu", "Bắc Kạn"
+]
+OFF_TOPIC_SECTIONS = [
+    "the-gioi", "the-thao", "giai-tri", "kinh-doanh", "so-hoa", "cong-nghe", "du-lich",
+    "oto-xe-may", "xe", "thoi-trang", "am-thuc", "van-hoa", "khoa-hoc", "suc-khoe",
+    "giao-duc", "tam-su", "cuoi", "bat-dong-san", "doi-song", "nhip-song-so"
+]
+OFF_TOPIC_CATEGORIES = [
+    "Thế giới", "Thể thao", "Giải trí", "Kinh doanh", "Số hóa", "Công nghệ", "Du lịch",
+    "Xe", "Văn hóa", "Khoa học", "Sức khỏe", "Giáo dục", "Bất động sản", "Đời sống"
+]
+
 # Keywords to filter out non-content sentences
 NOISE_KEYWORDS = [
     "lưu bài", "bỏ lưu", "đồng ý", "chia sẻ", "thành công", 
@@ -124,6 +232,70 @@ NOISE_KEYWORDS = [
     "cập nhật lúc", "chuyên mục", "tags:", "từ khóa"
 ]
 
+# Contains meaningful Vietnamese words
+MEANINGFUL_WORDS = ['là', 'có', 'được', 'tại', 'này', 'đã', 'sẽ', 'người', 'theo']
+
+# Important info indicators (bonus khi chấm điểm câu)
+IMPORTANT_INDICATORS = [
+    'xảy ra', 'diễn ra', 'gây ra', 'dẫn đến', 'khiến',
+    'thiệt hại', 'thương vong', 'bị thương', 'tử vong',
+    'tai nạn', 'va chạm', 'cháy', 'nổ', 'cướp', 'trộm',
+    'kẹt xe', 'ùn tắc', 'ngập', 'lũ lụt', 'sập', 'đổ',
+    'theo', 'cho biết', 'thông tin', 'cảnh báo'
+]
+
+# Generic content selectors - chỉ dùng cho host chưa có extraction plan
+CONTENT_SELECTORS = [
+    'article.fck_detail', 'div.fck_detail',
+    'div.singular-content', 'div.dt-news__content',
+    'div.ArticleContent', 'div.article-content',
+    'div#main-detail-content', 'div.detail-content',
+    'div.detail-content-body', 'div.cate-24h-content-detail',
+    'article', 'div[class*="content"]', 'div[class*="article"]',
+]
+
+# Per-domain extraction plans: đi thẳng tới container body đã biết của từng trang
+EXTRACTION_PLANS = {
+    "vnexpress.net": {
+        "title": "h1.title-detail",
+        "content": ["article.fck_detail", "div.fck_detail"],
+    },
+    "dantri.com.vn": {
+        "title": "h1.title-page",
+        "content": ["div.singular-content", "div.dt-news__content"],
+    },
+    "vietnamnet.vn": {
+        "title": "h1.content-detail-title",
+        "content": ["div.maincontent", "div.ArticleContent"],
+    },
+    "tuoitre.vn": {
+        "title": "h1.detail-title",
+        "content": ["div.detail-content", "div#main-detail-content"],
+    },
+    "thanhnien.vn": {
+        "title": "h1.detail-title",
+        "content": ["div.detail-content", "div#main-detail-content", "div.detail-content-body"],
+    },
+}
+
+# Selector biên dịch sẵn một lần (soupsieve) thay vì parse lại CSS mỗi trang
+_compiled_plans = {
+    host: {
+        "title": sv.compile(plan["title"]),
+        "content": [sv.compile(selector) for selector in plan["content"]],
+    }
+    for host, plan in EXTRACTION_PLANS.items()
+}
+_compiled_content_selectors = [sv.compile(selector) for selector in CONTENT_SELECTORS]
+
+# Streaming fetch cho trang bài: giới hạn kích thước, chỉ nhận HTML
+MAX_ARTICLE_BYTES = 2 * 1024 * 1024
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+STREAM_CHUNK_SIZE = 16 * 1024
+
+POPUP_PATTERN = re.compile(r"popup|modal|share|save|button|action|system|success|confirm|notification", re.I)
+STRIP_TAGS = ['script', 'style', 'iframe', 'noscript', 'button', 'a']
+
 def get_random_headers():
     """Get random user agent"""
     return {
@@ -132,24 +304,653 @@ def get_random_headers():
         'Accept-Language': 'vi-VN,vi;q=0.9,en-US;q=0.8,en;q=0.7',
     }
 
-def fetch_url(url: str, timeout: int = 15) -> Optional[requests.Response]:
-    """Fetch URL with retry"""
-    for attempt in range(3):
+# Host giả → host thật (vd. server replay của bench_crawl.py: "127.0.0.1:8801" → "vnexpress.net"),
+# để plan / token bucket / circuit breaker dùng đúng cấu hình của trang
+HOST_ALIASES: Dict[str, str] = {}
+
+def get_host(url: str) -> str:
+    """Host của URL (bỏ www.) - dùng làm khóa cho các giới hạn theo trang"""
+    host = urlparse(url).netloc.lower()
+    host = host[4:] if host.startswith('www.') else host
+    return HOST_ALIASES.get(host, host)
+
+class TokenBucket:
+    """Token bucket: trung bình `rate` request/giây, cho phép dồn tối đa `burst` request"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Lấy 1 token, trả về số giây phải chờ trước khi được gửi request"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1.0
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+class CircuitBreaker:
+    """
+    Circuit breaker của 1 host: closed → (threshold lỗi liên tiếp) → open, fail ngay trong `cooldown` giây
+    → half-open, cho 1 request thử: thành công thì closed, lỗi thì open lại với cooldown gấp đôi
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN,
+                 max_cooldown: float = BREAKER_MAX_COOLDOWN):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """Đang từ chối request (open, hoặc half-open đã có request thử) - chỉ xem, không giữ lượt thử như allow()"""
+        with self.lock:
+            return self.open_until != 0.0 and (time.monotonic() < self.open_until or self.probing)
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.open_until == 0.0:
+                return True
+            if time.monotonic() < self.open_until or self.probing:
+                return False
+            self.probing = True     # hết cooldown: cho đúng 1 request thử
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.open_until = 0.0
+            self.probing = False
+            self.cooldown = self.base_cooldown
+
+    def record_failure(self) -> bool:
+        """Ghi 1 lỗi; True nếu breaker vừa chuyển sang open"""
+        with self.lock:
+            self.failures += 1
+            if self.probing:
+                self.probing = False
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            elif self.failures < self.threshold or self.open_until:
+                return False
+            self.open_until = time.monotonic() + self.cooldown
+            return True
+
+    def open_for(self, seconds: float):
+        """Ngắt host ít nhất `seconds` giây (vd. theo Retry-After của server)"""
+        with self.lock:
+            self.open_until = max(self.open_until, time.monotonic() + min(seconds, self.max_cooldown))
+            self.probing = False
+
+# Host → tên nguồn (dùng khi chỉ có URL, vd. re-extract từ cache)
+HOST_SOURCES = {get_host(config['base_url']): source for source, config in SOURCES.items()}
+
+# Rate/burst cấu hình theo host, lấy từ SOURCES
+HOST_RATES = {
+    get_host(config['base_url']): (config.get('rate', DEFAULT_HOST_RATE), config.get('burst', DEFAULT_HOST_BURST))
+    for config in SOURCES.values()
+}
+_host_buckets: Dict[str, TokenBucket] = {}
+_host_buckets_lock = threading.Lock()
+
+def host_bucket(url: str) -> TokenBucket:
+    """Token bucket của host chứa URL (tạo khi dùng lần đầu)"""
+    host = get_host(url)
+    with _host_buckets_lock:
+        bucket = _host_buckets.get(host)
+        if bucket is None:
+            rate, burst = HOST_RATES.get(host, (DEFAULT_HOST_RATE, DEFAULT_HOST_BURST))
+            bucket = _host_buckets[host] = TokenBucket(rate, burst)
+        return bucket
+
+_host_breakers: Dict[str, CircuitBreaker] = {}
+
+def host_breaker(url: str) -> CircuitBreaker:
+    """Circuit breaker của host chứa URL (tạo khi dùng lần đầu)"""
+    host = get_host(url)
+    with _host_buckets_lock:
+        breaker = _host_breakers.get(host)
+        if breaker is None:
+            breaker = _host_breakers[host] = CircuitBreaker()
+        return breaker
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After dạng số giây hoặc HTTP-date → số giây chờ (None nếu không có / không hợp lệ)"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff với full jitter (tránh các worker retry cùng lúc)"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def failure_delay(url: str, breaker: CircuitBreaker, attempt: int, retry_after: Optional[str] = None) -> Optional[float]:
+    """
+    Ghi 1 lỗi tạm thời của host, trả về số giây chờ trước lần thử sau,
+    hoặc None nếu không nên thử lại (hết lượt, breaker vừa mở, Retry-After quá dài)
+    """
+    host = get_host(url)
+    if breaker.record_failure():
+        METRICS.inc("circuit_opened", host=host)
+        logger.warning(f"Circuit open for {host}: {breaker.failures} consecutive failures, cooling down {breaker.cooldown:.0f}s")
+        return None
+    if attempt + 1 >= FETCH_ATTEMPTS:
+        return None
+    delay = parse_retry_after(retry_after)
+    if delay is None:
+        return backoff_delay(attempt)
+    if delay > MAX_RETRY_AFTER:
+        breaker.open_for(delay)
+        METRICS.inc("circuit_opened", host=host)
+        logger.warning(f"{host} asked to retry after {delay:.0f}s - pausing host instead of waiting")
+        return None
+    return delay
+
+# Metrics của lần chạy (latency, bytes, retry, lý do loại bài...) - xem crawl_metrics.py
+METRICS = CrawlMetrics()
+
+def source_of(url: str) -> str:
+    """Tên nguồn (VnExpress, Dân Trí...) của URL, hoặc host nếu không thuộc SOURCES"""
+    host = get_host(url)
+    return HOST_SOURCES.get(host, host)
+
+def interleave_by_host(articles: List[Dict]) -> List[Dict]:
+    """Xếp xen kẽ bài theo host để worker không cùng chờ token của một trang"""
+    by_host: Dict[str, List[Dict]] = {}
+    for article in articles:
+        by_host.setdefault(get_host(article['url']), []).append(article)
+    queues = list(by_host.values())
+    result = []
+    for i in range(max((len(q) for q in queues), default=0)):
+        result.extend(q[i] for q in queues if i < len(q))
+    return result
+
+def fetch_url(url: str, timeout: int = 15, headers: Optional[Dict] = None,
+              stream: bool = False, mark_gone: bool = False) -> Optional[requests.Response]:
+    """
+    Fetch URL with retry - trả về response 200 hoặc 304 (khi gửi header điều kiện)
+    stream=True: chưa tải body, người gọi tự đọc (iter_content) và close()
+    mark_gone=True (URL bài): 4xx không retry được → mark_url_gone, không thử lại ở lần chạy sau
+    """
+    request_headers = get_random_headers()
+    if headers:
+        request_headers.update(headers)
+    host = get_host(url)
+    bucket = host_bucket(url)
+    breaker = host_breaker(url)
+    for attempt in range(FETCH_ATTEMPTS):
+        if breaker.is_open():
+            METRICS.inc("circuit_rejected", host=host)
+            logger.debug(f"Circuit open for {host}, skipping {url}")
+            return None
+        if attempt:
+            METRICS.inc("retries", host=host)
+        bucket.acquire()
+        # Breaker có thể đã mở trong lúc chờ token (request khác của host lỗi) → kiểm tra lại ngay trước khi gửi
+        if not breaker.allow():
+            METRICS.inc("circuit_rejected", host=host)
+            logger.debug(f"Circuit open for {host}, skipping {url}")
+            return None
+        retry_after = None
         try:
             response = requests.get(
                 url, 
-                headers=get_random_headers(),
-                timeout=timeout,
-                allow_redirects=True
+                headers=request_headers,
+                timeout=(CONNECT_TIMEOUT, timeout),
+                allow_redirects=True,
+                stream=stream
             )
-            if response.status_code == 200:
+            if response.status_code in (200, 304):
+                breaker.record_success()
+                if not stream:
+                    METRICS.inc("bytes", len(response.content), host=host)
                 return response
+            response.close()
+            METRICS.inc("http_errors", host=host, status=response.status_code)
             logger.warning(f"Status {response.status_code} for {url}")
+            if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_STATUSES:
+                # 404/403/410...: lỗi của URL chứ không phải của host, không retry
+                breaker.record_success()
+                if mark_gone:
+                    mark_url_gone(url, f"status {response.status_code}")
+                return None
+            retry_after = response.headers.get('Retry-After')
         except requests.RequestException as e:
+            METRICS.inc("http_errors", host=host, status="exception")
             logger.warning(f"Attempt {attempt+1} failed for {url}: {e}")
-            time.sleep(2 ** attempt)
+        
+        delay = failure_delay(url, breaker, attempt, retry_after)
+        if delay is None:
+            return None
+        time.sleep(delay)
     return None
 
+class ContainerWatcher:
+    """
+    Theo dõi HTML đang stream: báo khi container body của plan (vd. article.fck_detail)
+    đã mở rồi đóng lại, để ngừng tải phần còn lại của trang (footer, tin liên quan, script...)
+    """
+    START_OVERLAP = 512
+
+    def __init__(self, tag: str, attr: str, value: str):
+        tag_bytes = re.escape(tag.encode())
+        # Khớp nguyên 1 token trong giá trị thuộc tính: "detail-content" không được khớp "detail-content-top"
+        self.start_pattern = re.compile(
+            rb'<' + tag_bytes + rb'\b[^>]*\s' + attr.encode() + rb'\s*=\s*["\'](?:[^"\'>]*\s)?'
+            + re.escape(value.encode()) + rb'(?=[\s"\'])',
+            re.I
+        )
+        self.tag_pattern = re.compile(rb'<(/?)' + tag_bytes + rb'\b', re.I)
+        self.tail = len(tag) + 2
+        self.pos = 0
+        self.depth = 0
+        self.started = False
+
+    @classmethod
+    def for_url(cls, url: str) -> Optional["ContainerWatcher"]:
+        """Watcher theo selector đầu tiên của plan (dạng tag.class hoặc tag#id), None nếu không có"""
+        plan = EXTRACTION_PLANS.get(get_host(url))
+        match = plan and re.fullmatch(r'(\w+)([.#])([\w-]+)', plan['content'][0])
+        if not match:
+            return None
+        tag, kind, value = match.groups()
+        return cls(tag, 'class' if kind == '.' else 'id', value)
+
+    def feed(self, buf: bytes) -> bool:
+        """Gọi sau mỗi chunk với toàn bộ buffer; True khi container đã đóng"""
+        if not self.started:
+            match = self.start_pattern.search(buf, max(0, self.pos - self.START_OVERLAP))
+            if not match:
+                self.pos = len(buf)
+                return False
+            self.started = True
+            self.depth = 1
+            self.pos = match.end()
+        
+        for match in self.tag_pattern.finditer(buf, self.pos):
+            if match.end() >= len(buf):
+                break   # tag có thể bị cắt giữa chunk, chờ chunk sau
+            self.pos = match.end()
+            self.depth += -1 if match.group(1) else 1
+            if self.depth == 0:
+                return True
+        self.pos = max(self.pos, len(buf) - self.tail)
+        return False
+
+def is_html_content_type(content_type: str) -> bool:
+    # Không có Content-Type thì cho qua, để BeautifulSoup tự xử lý
+    return not content_type or content_type.lower().startswith(HTML_CONTENT_TYPES)
+
+def fetch_html(url: str, timeout: int = 15, max_bytes: int = MAX_ARTICLE_BYTES,
+               stop_early: bool = True) -> Tuple[Optional[bytes], bool]:
+    """
+    Tải trang bài dạng stream: bỏ ngay nếu không phải HTML hoặc Content-Length quá max_bytes,
+    dừng khi container body của plan đã đóng (stop_early), cắt ở max_bytes nếu trang quá nặng.
+    Trả về (body, truncated) - truncated=True khi ngừng đọc sớm ở container (body không phải cả trang)
+    """
+    started = time.perf_counter()
+    response = fetch_url(url, timeout=timeout, stream=True, mark_gone=True)
+    if not response:
+        return None, False
+    buf = bytearray()
+    truncated = False
+    try:
+        content_type = response.headers.get('Content-Type', '')
+        if not is_html_content_type(content_type):
+            logger.warning(f"Skipping non-HTML content ({content_type}) for {url}")
+            mark_url_gone(url, "non-HTML")
+            return None, False
+        declared = response.headers.get('Content-Length', '')
+        if declared.isdigit() and int(declared) > max_bytes:
+            logger.warning(f"Skipping {url}: Content-Length {declared} > {max_bytes} bytes")
+            mark_url_gone(url, "too large")
+            return None, False
+        
+        watcher = ContainerWatcher.for_url(url) if stop_early else None
+        for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+            buf.extend(chunk)
+            if watcher and watcher.feed(buf):
+                logger.debug(f"Article container closed after {len(buf)} bytes, stopped reading {url}")
+                truncated = True
+                break
+            if len(buf) >= max_bytes:
+                logger.warning(f"Page larger than {max_bytes} bytes, truncated: {url}")
+                del buf[max_bytes:]
+                break
+        return bytes(buf), truncated
+    except requests.RequestException as e:
+        logger.warning(f"Streaming failed for {url}: {e}")
+        return None, False
+    finally:
+        response.close()
+        METRICS.inc("bytes", len(buf), host=get_host(url))
+        METRICS.observe("article_fetch_seconds", time.perf_counter() - started, source=source_of(url))
+
+async def fetch_url_async(session: "aiohttp.ClientSession", url: str, timeout: int = 15,
+                          max_bytes: int = MAX_ARTICLE_BYTES) -> Tuple[Optional[bytes], bool]:
+    """Fetch trang bài with retry (asyncio version of fetch_html: stream, giới hạn kích thước, chỉ HTML) → (body, truncated)"""
+    host = get_host(url)
+    bucket = host_bucket(url)
+    breaker = host_breaker(url)
+    started = time.perf_counter()
+    for attempt in range(FETCH_ATTEMPTS):
+        if breaker.is_open():
+            METRICS.inc("circuit_rejected", host=host)
+            logger.debug(f"Circuit open for {host}, skipping {url}")
+            return None, False
+        if attempt:
+            METRICS.inc("retries", host=host)
+        await bucket.acquire_async()
+        # Mọi task bắt đầu cùng lúc và chờ token → breaker phải kiểm tra lại ngay trước khi gửi
+        if not breaker.allow():
+            METRICS.inc("circuit_rejected", host=host)
+            logger.debug(f"Circuit open for {host}, skipping {url}")
+            return None, False
+        retry_after = None
+        try:
+            async with session.get(
+                url,
+                headers=get_random_headers(),
+                timeout=aiohttp.ClientTimeout(total=timeout, sock_connect=CONNECT_TIMEOUT),
+                allow_redirects=True
+            ) as response:
+                if response.status == 200:
+                    breaker.record_success()
+                    content_type = response.headers.get('Content-Type', '')
+                    if not is_html_content_type(content_type):
+                        logger.warning(f"Skipping non-HTML content ({content_type}) for {url}")
+                        mark_url_gone(url, "non-HTML")
+                        return None, False
+                    if response.content_length and response.content_length > max_bytes:
+                        logger.warning(f"Skipping {url}: Content-Length {response.content_length} > {max_bytes} bytes")
+                        mark_url_gone(url, "too large")
+                        return None, False
+                    
+                    watcher = ContainerWatcher.for_url(url)
+                    buf = bytearray()
+                    truncated = False
+                    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                        buf.extend(chunk)
+                        if watcher and watcher.feed(buf):
+                            truncated = True
+                            break
+                        if len(buf) >= max_bytes:
+                            logger.warning(f"Page larger than {max_bytes} bytes, truncated: {url}")
+                            del buf[max_bytes:]
+                            break
+                    METRICS.inc("bytes", len(buf), host=host)
+                    METRICS.observe("article_fetch_seconds", time.perf_counter() - started, source=source_of(url))
+                    return bytes(buf), truncated
+                METRICS.inc("http_errors", host=host, status=response.status)
+                logger.warning(f"Status {response.status} for {url}")
+                if 400 <= response.status < 500 and response.status not in RETRYABLE_STATUSES:
+                    breaker.record_success()
+                    mark_url_gone(url, f"status {response.status}")
+                    return None, False
+                retry_after = response.headers.get('Retry-After')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            METRICS.inc("http_errors", host=host, status="exception")
+            logger.warning(f"Attempt {attempt+1} failed for {url}: {e}")
+        
+        delay = failure_delay(url, breaker, attempt, retry_after)
+        if delay is None:
+            return None, False
+        await asyncio.sleep(delay)
+    return None, False
+
+# Cache validator của RSS feed: {rss_url: {etag, last_modified, body_hash, pending, listed, new_items, checked_at}}
+# pending: bài lần parse gần nhất liệt kê; khi feed 304 / không đổi, bài nào chưa vào URL frontier
+# (lỗi tạm thời: 5xx, timeout, circuit breaker mở, lần chạy bị ngắt...) được trả lại để thử tải tiếp.
+# Lỗi vĩnh viễn không được trả lại: 4xx / không phải HTML / quá nặng → mark_url_gone (vào frontier),
+# bị prefilter bỏ → drop_pending
+# listed / new_items: URL (canonical) của lần parse gần nhất / số URL mới so với lần trước (daemon + chu kỳ poll)
+_feed_cache: Dict[str, Dict] = {}
+_feed_cache_lock = threading.Lock()
+
+def load_feed_cache(path: Path = FEED_CACHE_FILE):
+    """Đọc cache validator của feed từ đĩa (bỏ qua nếu chưa có/hỏng)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            with _feed_cache_lock:
+                _feed_cache.update(data)
+        logger.info(f"Loaded feed cache for {len(data)} feeds")
+    except FileNotFoundError:
+        pass
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f"Invalid feed cache {path}: {e}. Starting fresh")
+
+def save_feed_cache(path: Path = FEED_CACHE_FILE):
+    """Ghi cache validator của feed (ghi file tạm rồi rename)"""
+    with _feed_cache_lock:
+        data = dict(_feed_cache)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def get_feed_cache(rss_url: str) -> Dict:
+    with _feed_cache_lock:
+        return dict(_feed_cache.get(rss_url, {}))
+
+def update_feed_cache(rss_url: str, **fields):
+    with _feed_cache_lock:
+        _feed_cache.setdefault(rss_url, {}).update(fields)
+
+def pending_entry(article: Dict) -> Dict:
+    """Bài RSS → dạng lưu được trong feed cache (pub_date ISO)"""
+    return dict(article, pub_date=article['pub_date'].isoformat(timespec='seconds'))
+
+def drop_pending(urls: List[str]):
+    """Bỏ các URL (vd. bị prefilter loại) khỏi pending của mọi feed - feed 304 không trả lại chúng nữa"""
+    dropped = {canonicalize_url(url) for url in urls}
+    if not dropped:
+        return
+    with _feed_cache_lock:
+        for cached in _feed_cache.values():
+            if cached.get('pending'):
+                cached['pending'] = [entry for entry in cached['pending']
+                                     if canonicalize_url(entry.get('url', '')) not in dropped]
+
+def retry_pending(rss_url: str, cached: Dict) -> List[Dict]:
+    """Bài lần parse trước đã liệt kê nhưng chưa tải được (chưa có trong URL frontier), còn trong 24h"""
+    cutoff = datetime.now() - timedelta(hours=24)
+    articles = []
+    for entry in cached.get('pending', []):
+        try:
+            pub_date = datetime.fromisoformat(entry['pub_date'])
+            if pub_date >= cutoff:
+                articles.append(dict(entry, pub_date=pub_date))
+        except (KeyError, TypeError, ValueError):
+            continue
+    articles = filter_unseen(articles)
+    update_feed_cache(rss_url, pending=[pending_entry(a) for a in articles])
+    return articles
+
+# URL frontier: bài đã tải (canonical URL → epoch giây), bỏ qua trước Phase 2
+_seen_urls: Dict[str, float] = {}
+_seen_urls_lock = threading.Lock()
+_frontier_dirty = False     # có thay đổi chưa ghi xuống đĩa (save_url_frontier bỏ qua nếu không)
+FRONTIER_RETENTION_DAYS = 30
+TRACKING_PARAM_PREFIXES = ('utm_', 'fbclid', 'gclid', 'zarsrc', 'zoneid')
+
+def canonicalize_url(url: str) -> str:
+    """Chuẩn hóa URL bài báo: https, host thường (bỏ www.), bỏ fragment/tham số tracking, bỏ / cuối"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    path = parts.path or '/'
+    if len(path) > 1:
+        path = path.rstrip('/')
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAM_PREFIXES)
+    )
+    return urlunsplit(('https', host, path, urlencode(query), ''))
+
+def load_url_frontier(path: Path = URL_FRONTIER_FILE):
+    """Đọc frontier từ đĩa, bỏ các URL cũ hơn FRONTIER_RETENTION_DAYS"""
+    global _frontier_dirty
+    cutoff = time.time() - FRONTIER_RETENTION_DAYS * 86400
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        with _seen_urls_lock:
+            _seen_urls.update({u: ts for u, ts in data.items() if ts >= cutoff})
+            _frontier_dirty = len(_seen_urls) < len(data)
+        logger.info(f"Loaded URL frontier: {len(_seen_urls)} known URLs")
+    except FileNotFoundError:
+        pass
+    except (json.JSONDecodeError, OSError, AttributeError) as e:
+        logger.warning(f"Invalid URL frontier {path}: {e}. Starting fresh")
+
+def prune_url_frontier() -> int:
+    """Bỏ URL cũ hơn FRONTIER_RETENTION_DAYS khỏi frontier trong bộ nhớ (daemon gọi mỗi vòng); trả về số URL đã bỏ"""
+    global _frontier_dirty
+    cutoff = time.time() - FRONTIER_RETENTION_DAYS * 86400
+    with _seen_urls_lock:
+        expired = [url for url, ts in _seen_urls.items() if ts < cutoff]
+        for url in expired:
+            del _seen_urls[url]
+        if expired:
+            _frontier_dirty = True
+    return len(expired)
+
+def save_url_frontier(path: Path = URL_FRONTIER_FILE):
+    """Ghi frontier xuống đĩa (atomic); không có URL mới / URL bị bỏ từ lần ghi trước thì bỏ qua"""
+    global _frontier_dirty
+    with _seen_urls_lock:
+        if not _frontier_dirty and path.exists():
+            return
+        data = dict(_seen_urls)
+        _frontier_dirty = False
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def mark_url_seen(url: str):
+    global _frontier_dirty
+    with _seen_urls_lock:
+        _seen_urls[canonicalize_url(url)] = time.time()
+        _frontier_dirty = True
+
+def mark_url_gone(url: str, reason: str):
+    """Bài không bao giờ tải được (4xx, không phải HTML, quá nặng): đưa vào frontier như bài đã tải để không retry mãi"""
+    logger.debug(f"Permanent failure ({reason}), not retrying: {url}")
+    mark_url_seen(url)
+
+def filter_unseen(articles: List[Dict], recheck_hours: Optional[float] = None) -> List[Dict]:
+    """
+    Bỏ bài có URL đã tải ở các lần chạy trước (và URL trùng trong cùng lần chạy).
+    recheck_hours: cho phép tải lại URL đã thấy quá số giờ này (bắt bài được cập nhật)
+    """
+    recheck_before = time.time() - recheck_hours * 3600 if recheck_hours else None
+    fresh = []
+    batch_urls = set()
+    with _seen_urls_lock:
+        for article in articles:
+            canonical = canonicalize_url(article['url'])
+            if canonical in batch_urls:
+                continue
+            seen_at = _seen_urls.get(canonical)
+            if seen_at is not None and (recheck_before is None or seen_at > recheck_before):
+                continue
+            batch_urls.add(canonical)
+            fresh.append(article)
+    return fresh
+
+# Raw HTML cache: mọi body bài đã tải, lưu nén theo nội dung (content-addressed)
+HTML_CACHE_ENABLED = True
+_html_cache_lock = threading.Lock()
+
+def html_cache_path(digest: str) -> Path:
+    return HTML_CACHE_DIR / "objects" / digest[:2] / f"{digest}.html.gz"
+
+def store_html(url: str, body: bytes, truncated: bool = False) -> str:
+    """
+    Lưu body (gzip) theo sha256 và ghi 1 dòng index {url, fetched_at, sha256, source[, truncated]}
+    truncated: body dừng ở container của plan, không phải cả trang (--reextract --refetch-truncated tải lại đầy đủ)
+    """
+    digest = hashlib.sha256(body).hexdigest()
+    obj_path = html_cache_path(digest)
+    if not obj_path.exists():
+        obj_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = obj_path.with_name(f"{obj_path.name}.{threading.get_ident()}.tmp")
+        with gzip.open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, obj_path)
+    
+    entry = {
+        'url': url,
+        'fetched_at': datetime.now().isoformat(timespec='seconds'),
+        'sha256': digest,
+        'source': HOST_SOURCES.get(get_host(url), ''),
+    }
+    if truncated:
+        entry['truncated'] = True
+    with _html_cache_lock:
+        with open(HTML_CACHE_DIR / "index.jsonl", 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return digest
+
+def load_cached_html(digest: str) -> bytes:
+    with gzip.open(html_cache_path(digest), 'rb') as f:
+        return f.read()
+
+def iter_html_cache(since: Optional[datetime] = None) -> List[Dict]:
+    """Entry index mới nhất của mỗi URL (tải sau `since` nếu có)"""
+    latest: Dict[str, Dict] = {}
+    try:
+        with open(HTML_CACHE_DIR / "index.jsonl", 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if since and datetime.fromisoformat(entry['fetched_at']) < since:
+                    continue
+                latest[entry['url']] = entry
+    except FileNotFoundError:
+        pass
+    return list(latest.values())
+
+def record_fetched_article(url: str, body: bytes, truncated: bool = False):
+    """Gọi ngay sau khi tải được một trang bài: đánh dấu URL đã thấy + lưu HTML thô"""
+    mark_url_seen(url)
+    if HTML_CACHE_ENABLED:
+        try:
+            store_html(url, body, truncated)
+        except OSError as e:
+            logger.warning(f"Could not cache HTML for {url}: {e}")
+
 def clean_sentence(sentence: str) -> str:
     """Clean and validate sentence"""
     sentence = sentence.strip()
@@ -157,42 +958,115 @@ def clean_sentence(sentence: str) -> str:
     sentence = re.sub(r'\s+', ' ', sentence)
     return sentence
 
-def is_valid_content_sentence(sentence: str) -> bool:
-    """Check if sentence is valid content (not noise/UI elements)"""
-    sentence_lower = sentence.lower()
+class SentenceHits(NamedTuple):
+    """Số keyword (khác nhau) của từng nhóm xuất hiện trong một câu"""
+    noise: int
+    meaningful: int
+    hanoi: int
+    indicators: int
+
+def _build_keyword_matcher(groups: List[List[str]]):
+    """
+    Gộp mọi nhóm keyword thành MỘT regex alternation (keyword dài trước).
+    Trả về (pattern, prefixes, slots): prefixes[kw] = các keyword là tiền tố của kw
+    (cùng khớp tại vị trí đó), slots[kw] = các nhóm chứa kw
+    """
+    owners: Dict[str, set] = {}
+    for slot, words in enumerate(groups):
+        for word in words:
+            owners.setdefault(word.lower(), set()).add(slot)
+    keywords = sorted(owners, key=len, reverse=True)
+    pattern = re.compile('|'.join(re.escape(kw) for kw in keywords))
+    prefixes = {kw: tuple(other for other in keywords if kw.startswith(other)) for kw in keywords}
+    slots = {kw: tuple(sorted(owner)) for kw, owner in owners.items()}
+    return pattern, prefixes, slots
+
+# Thứ tự nhóm khớp với các field của SentenceHits
+_keyword_pattern, _keyword_prefixes, _keyword_slots = _build_keyword_matcher(
+    [NOISE_KEYWORDS, MEANINGFUL_WORDS, HANOI_KEYWORDS, IMPORTANT_INDICATORS]
+)
+HANOI_PATTERN = re.compile('|'.join(re.escape(kw.lower()) for kw in HANOI_KEYWORDS))
+HANOI_DISTRICT_PATTERN = re.compile(r'\b(?:' + '|'.join(re.escape(d.lower()) for d in HANOI_DISTRICTS) + r')\b')
+OTHER_PROVINCE_PATTERN = re.compile(r'\b(?:' + '|'.join(re.escape(p.lower()) for p in OTHER_PROVINCES) + r')\b')
+INDICATOR_PATTERN = re.compile('|'.join(re.escape(kw) for kw in IMPORTANT_INDICATORS if kw not in ('theo', 'thông tin', 'cho biết')))
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+SPECIAL_CHAR_PATTERN = re.compile(r'[^\w\s]')
+
+def classify_sentence(sentence: str) -> SentenceHits:
+    """
+    Một lượt quét regex cho cả 4 nhóm keyword (noise / meaningful / Hà Nội / indicator).
+    Tìm lại từ start+1 sau mỗi match nên keyword chồng lấn nhau vẫn được đếm,
+    kết quả giống hệt các phép `kw in sentence.lower()` riêng lẻ.
+    """
+    text = sentence.lower()
+    found = set()
+    search = _keyword_pattern.search
+    match = search(text)
+    while match:
+        found.update(_keyword_prefixes[match.group()])
+        match = search(text, match.start() + 1)
     
+    counts = [0, 0, 0, 0]
+    for kw in found:
+        for slot in _keyword_slots[kw]:
+            counts[slot] += 1
+    return SentenceHits(*counts)
+
+def is_valid_content_sentence(sentence: str, hits: Optional[SentenceHits] = None) -> bool:
+    """Check if sentence is valid content (not noise/UI elements)"""
     # Too short
     if len(sentence) < 30:
         return False
     
+    if hits is None:
+        hits = classify_sentence(sentence)
+    
     # Contains noise keywords
-    if any(noise in sentence_lower for noise in NOISE_KEYWORDS):
+    if hits.noise:
         return False
     
     # Too many special characters
-    special_char_ratio = len(re.findall(r'[^\w\s]', sentence)) / len(sentence)
+    special_char_ratio = len(SPECIAL_CHAR_PATTERN.findall(sentence)) / len(sentence)
     if special_char_ratio > 0.3:
         return False
     
     # Contains meaningful Vietnamese words
-    meaningful_words = ['là', 'có', 'được', 'tại', 'này', 'đã', 'sẽ', 'người', 'theo']
-    if not any(word in sentence_lower for word in meaningful_words):
+    if not hits.meaningful:
         return False
     
     return True
 
-def extract_article_content(url: str) -> Optional[Dict]:
-    """Fetch và extract nội dung đầy đủ của bài báo"""
-    response = fetch_url(url)
-    if not response:
-        return None
+def container_text(content_div, strip_popups: bool = True) -> str:
+    """Lấy text các đoạn <p> hợp lệ trong container (sau khi bỏ script/link/popup)"""
+    for tag in content_div(STRIP_TAGS):
+        tag.decompose()
+    if strip_popups:
+        for popup_tag in content_div.find_all(["div", "section"], {"class": POPUP_PATTERN, "id": POPUP_PATTERN}):
+            popup_tag.decompose()
+    
+    texts = []
+    for p in content_div.find_all('p', recursive=True):
+        text = clean_sentence(p.get_text(separator=' ', strip=True))
+        if is_valid_content_sentence(text):
+            texts.append(text)
+    return ' '.join(texts)
+
+def extract_article_content(url: str, html: Optional[bytes] = None) -> Optional[Dict]:
+    """Fetch và extract nội dung đầy đủ của bài báo (bỏ qua fetch nếu đã có html)"""
+    if html is None:
+        html, truncated = fetch_html(url)
+        if html is None:
+            return None
+        record_fetched_article(url, html, truncated)
     
     try:
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        plan = _compiled_plans.get(get_host(url))
         
         # Extract title
         title = ""
-        h1 = soup.find('h1')
+        h1 = (plan and plan['title'].select_one(soup)) or soup.find('h1')
         if h1:
             title = h1.get_text(strip=True)
         elif soup.title:
@@ -201,37 +1075,25 @@ def extract_article_content(url: str) -> Optional[Dict]:
         # Extract main content
         content_text = ""
         
-        content_selectors = [
-            'article.fck_detail', 'div.fck_detail',
-            'div.singular-content', 'div.dt-news__content',
-            'div.ArticleContent', 'div.article-content',
-            'div#main-detail-content', 'div.detail-content',
-            'div.detail-content-body', 'div.cate-24h-content-detail',
-            'article', 'div[class*="content"]', 'div[class*="article"]',
-        ]
+        # Host đã biết: chỉ thử container của plan, không quét popup
+        if plan:
+            for selector in plan['content']:
+                content_div = selector.select_one(soup)
+                if content_div:
+                    content_text = container_text(content_div, strip_popups=False)
+                    if len(content_text) > 200:
+                        break
+            if len(content_text) <= 200:
+                logger.debug(f"Extraction plan missed for {url}, using generic selectors")
         
-        for selector in content_selectors:
-            content_div = soup.select_one(selector)
-            if content_div:
-                for tag in content_div(['script', 'style', 'iframe', 'noscript', 'button', 'a']):
-                    tag.decompose()
-                for popup_tag in content_div.find_all(
-                    ["div", "section"],
-                    {"class": re.compile(r"popup|modal|share|save|button|action|system|success|confirm|notification", re.I),
-                     "id": re.compile(r"popup|modal|share|save|button|action|system|success|confirm|notification", re.I)}
-                ):
-                    popup_tag.decompose()
-                
-                paragraphs = content_div.find_all('p', recursive=True)
-                texts = []
-                for p in paragraphs:
-                    text = clean_sentence(p.get_text(separator=' ', strip=True))
-                    if is_valid_content_sentence(text):
-                        texts.append(text)
-                
-                content_text = ' '.join(texts)
-                if len(content_text) > 200:
-                    break
+        # Host lạ (hoặc plan trượt): cascade selector chung
+        if len(content_text) <= 200:
+            for selector in _compiled_content_selectors:
+                content_div = selector.select_one(soup)
+                if content_div:
+                    content_text = container_text(content_div)
+                    if len(content_text) > 200:
+                        break
         
         if len(content_text) < 200:
             paragraphs = soup.find_all('p')
@@ -300,7 +1162,7 @@ Chỉ trả về JSON, không text khác."""
 
     try:
         response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
+            model=LLM_MODEL,
             messages=[
                 {"role": "system", "content": "Bạn là chuyên gia phân tích và tóm tắt tin tức về Hà Nội. Tóm tắt phải CHÍNH XÁC 100 từ và giữ thông tin quan trọng nhất."},
                 {"role": "user", "content": prompt}
@@ -317,27 +1179,18 @@ Chỉ trả về JSON, không text khác."""
         logger.error(f"LLM extraction failed: {e}")
         return None
 
-def calculate_sentence_score(sentence: str, hanoi_keywords: List[str]) -> float:
-    """Calculate relevance score for a sentence"""
-    score = 0.0
-    sentence_lower = sentence.lower()
-    
-    # Bonus for Hanoi keywords
-    for kw in hanoi_keywords:
-        if kw.lower() in sentence_lower:
-            score += 2.0
-    
-    # Bonus for containing important info indicators
-    important_indicators = [
-        'xảy ra', 'diễn ra', 'gây ra', 'dẫn đến', 'khiến',
-        'thiệt hại', 'thương vong', 'bị thương', 'tử vong',
-        'tai nạn', 'va chạm', 'cháy', 'nổ', 'cướp', 'trộm',
-        'kẹt xe', 'ùn tắc', 'ngập', 'lũ lụt', 'sập', 'đổ',
-        'theo', 'cho biết', 'thông tin', 'cảnh báo'
-    ]
-    for indicator in important_indicators:
-        if indicator in sentence_lower:
-            score += 1.0
+# Trọng số feature câu cho summarize_batch: [hanoi, indicators, câu ngắn (<50), câu hỏi]
+# (cùng công thức với calculate_sentence_score)
+SENTENCE_FEATURE_WEIGHTS = np.array([2.0, 1.0, -2.0, -1.0]) if NUMPY_AVAILABLE else None
+SENTENCE_SPLIT_PATTERN = re.compile(r'[.!?]\s+')
+
+def calculate_sentence_score(sentence: str, hits: Optional[SentenceHits] = None) -> float:
+    """Calculate relevance score for a sentence (dùng lại hits nếu đã classify)"""
+    if hits is None:
+        hits = classify_sentence(sentence)
+    
+    # Bonus for Hanoi keywords + important info indicators
+    score = 2.0 * hits.hanoi + 1.0 * hits.indicators
     
     # Penalty for very short sentences
     if len(sentence) < 50:
@@ -349,42 +1202,30 @@ def calculate_sentence_score(sentence: str, hanoi_keywords: List[str]) -> float:
     
     return score
 
-def extract_intelligent_summary(title: str, content: str) -> str:
-    """Extract intelligent summary based on sentence scoring - 100 từ"""
-    
-    # Split into sentences
-    sentences = re.split(r'[.!?]\s+', content)
-    
-    # Score each sentence
-    scored_sentences = []
-    for sent in sentences:
-        sent = clean_sentence(sent)
-        if is_valid_content_sentence(sent):
-            score = calculate_sentence_score(sent, HANOI_KEYWORDS)
-            scored_sentences.append((score, sent))
-    
-    # Sort by score (descending)
-    scored_sentences.sort(reverse=True, key=lambda x: x[0])
-    
-    # Select top sentences up to word limit (100 từ)
-    selected_sentences = []
+def split_sentences(content: str) -> List[Tuple[int, str]]:
+    """Tách câu giống re.split(r'[.!?]\\s+') nhưng giữ offset bắt đầu của từng câu trong content"""
+    pieces = []
+    start = 0
+    for match in SENTENCE_SPLIT_PATTERN.finditer(content):
+        pieces.append((start, content[start:match.start()]))
+        start = match.end()
+    pieces.append((start, content[start:]))
+    return pieces
+
+def select_by_word_budget(word_counts: List[int], target_words: int = 100) -> List[int]:
+    """Chọn câu (đã xếp theo điểm giảm dần) tới khi đủ ~target_words từ, trả về vị trí được chọn"""
+    selected = []
     word_count = 0
-    target_words = 100
-    
-    for score, sent in scored_sentences:
+    for i, sent_words in enumerate(word_counts):
         if word_count >= target_words:
             break
-        sent_words = len(sent.split())
         if word_count + sent_words <= target_words + 20:  # Allow slight overflow
-            selected_sentences.append((score, sent))
+            selected.append(i)
             word_count += sent_words
-    
-    # Sort selected sentences by their original order in text
-    sentence_order = {sent: content.find(sent) for _, sent in selected_sentences}
-    selected_sentences.sort(key=lambda x: sentence_order.get(x[1], 999999))
-    
-    # Build summary
-    summary_parts = [sent for _, sent in selected_sentences]
+    return selected
+
+def build_summary(summary_parts: List[str], sentences: List[str]) -> str:
+    """Ghép câu đã chọn (theo thứ tự gốc) thành summary, fallback + cắt ~100 từ"""
     summary = ". ".join(summary_parts)
     
     # Ensure proper ending
@@ -406,78 +1247,282 @@ def extract_intelligent_summary(title: str, content: str) -> str:
     
     return summary
 
-def extract_with_rules(title: str, content: str) -> Dict:
-    """Enhanced rule-based extraction with intelligent summarization"""
+def extract_intelligent_summary(title: str, content: str) -> str:
+    """Extract intelligent summary based on sentence scoring - 100 từ"""
+    
+    # Split into sentences (giữ offset để xếp lại thứ tự, không cần content.find)
+    pieces = split_sentences(content)
+    
+    # Score each sentence
+    scored_sentences = []
+    for offset, sent in pieces:
+        sent = clean_sentence(sent)
+        hits = classify_sentence(sent)
+        if is_valid_content_sentence(sent, hits):
+            score = calculate_sentence_score(sent, hits)
+            scored_sentences.append((score, offset, sent))
+    
+    # Sort by score (descending)
+    scored_sentences.sort(reverse=True, key=lambda x: x[0])
+    
+    # Select top sentences up to word limit (100 từ)
+    chosen = select_by_word_budget([len(sent.split()) for _, _, sent in scored_sentences])
+    selected_sentences = [scored_sentences[i] for i in chosen]
+    
+    # Sort selected sentences by their original order in text
+    selected_sentences.sort(key=lambda x: x[1])
+    
+    return build_summary([sent for _, _, sent in selected_sentences], [sent for _, sent in pieces])
+
+def summarize_batch(articles: List[Tuple[str, str]]) -> List[str]:
+    """
+    Tóm tắt nhiều bài (title, content) một lượt, cùng kết quả với extract_intelligent_summary:
+    dựng ma trận câu × feature cho cả batch, chấm điểm bằng một phép nhân ma trận,
+    xếp hạng bằng lexsort và trả câu về thứ tự gốc bằng offset lúc tách câu.
+    """
+    if not NUMPY_AVAILABLE:
+        return [extract_intelligent_summary(title, content) for title, content in articles]
+    
+    all_pieces = []
+    features, article_ids, offsets, sentences, word_counts = [], [], [], [], []
+    for article_id, (title, content) in enumerate(articles):
+        pieces = split_sentences(content)
+        all_pieces.append(pieces)
+        for offset, sent in pieces:
+            sent = clean_sentence(sent)
+            hits = classify_sentence(sent)
+            if is_valid_content_sentence(sent, hits):
+                features.append((hits.hanoi, hits.indicators, len(sent) < 50, '?' in sent))
+                article_ids.append(article_id)
+                offsets.append(offset)
+                sentences.append(sent)
+                word_counts.append(len(sent.split()))
+    
+    scores = np.asarray(features, dtype=np.float64).reshape(-1, len(SENTENCE_FEATURE_WEIGHTS)) @ SENTENCE_FEATURE_WEIGHTS
+    article_ids = np.asarray(article_ids, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    word_counts = np.asarray(word_counts, dtype=np.int64)
+    
+    # Theo bài, điểm giảm dần, cùng điểm thì câu đứng trước được ưu tiên (như sort ổn định)
+    order = np.lexsort((offsets, -scores, article_ids))
+    bounds = np.searchsorted(article_ids[order], np.arange(len(articles) + 1))
+    
+    summaries = []
+    for article_id, pieces in enumerate(all_pieces):
+        ranked = order[bounds[article_id]:bounds[article_id + 1]]
+        chosen = ranked[select_by_word_budget(word_counts[ranked].tolist())]
+        chosen = chosen[np.argsort(offsets[chosen], kind='stable')]
+        summaries.append(build_summary([sentences[i] for i in chosen], [sent for _, sent in pieces]))
+    return summaries
+
+def summarize_events(events: List[Dict]):
+    """
+    Điền summary cho các event tạo bằng process_article(..., summarize=False) bằng một lần
+    summarize_batch (dùng khi có sẵn nhiều bài: --reextract, parse stage của engine pipeline)
+    """
+    pending = [event for event in events if event and '_summary_input' in event]
+    if not pending:
+        return
+    with METRICS.timer("summarize_batch_seconds"):
+        summaries = summarize_batch([event.pop('_summary_input') for event in pending])
+    for event, summary in zip(pending, summaries):
+        event['summary'] = summary
+
+def extract_with_rules(title: str, content: str, summarize: bool = True) -> Dict:
+    """Enhanced rule-based extraction with intelligent summarization (summarize=False: chỉ kiểm tra Hà Nội)"""
     text = f"{title} {content}".lower()
     
     # Check Hanoi relevance
-    is_hanoi = any(kw.lower() in text for kw in HANOI_KEYWORDS)
+    is_hanoi = HANOI_PATTERN.search(text) is not None
     if not is_hanoi:
         return {"is_hanoi_related": False}
     
     # Generate intelligent summary (100 từ)
-    summary = extract_intelligent_summary(title, content)
+    summary = extract_intelligent_summary(title, content) if summarize else None
     
     return {
         "is_hanoi_related": True,
         "summary": summary
     }
 
-def process_article(article_meta: Dict) -> Optional[Dict]:
-    """Process một bài báo hoàn chỉnh"""
+def process_article(article_meta: Dict, html: Optional[bytes] = None, summarize: bool = True) -> Optional[Dict]:
+    """
+    Process một bài báo hoàn chỉnh
+    summarize=False: chưa tóm tắt, event mang '_summary_input' để summarize_events() làm theo lô
+    """
     url = article_meta['url']
+    source = article_meta['source']
+    
+    if html is None:
+        logger.info(f"Fetching: {url}")
+        html, truncated = fetch_html(url)
+        if html is None:
+            METRICS.drop("fetch_failed", source=source)
+            return None
+        record_fetched_article(url, html, truncated)
     
-    logger.info(f"Fetching: {url}")
-    article_content = extract_article_content(url)
+    with METRICS.timer("parse_seconds", source=source):
+        article_content = extract_article_content(url, html)
     
     if not article_content:
+        METRICS.drop("short_content", source=source)
         return None
     
     title = article_content['title']
     content = article_content['content']
     
-    # Try LLM first if available
+    # Enhanced rule-based extraction
+    with METRICS.timer("summarize_seconds", source=source):
+        rule_result = extract_with_rules(title, content, summarize=summarize)
+    
+    event = {
+        'title': title,
+        'url': url,
+        'source': article_meta['source'],
+        'date': article_content['publish_date'],
+        'summary': rule_result['summary'] if rule_result.get('is_hanoi_related') else None,
+        'content_hash': hashlib.sha256(content.encode()).hexdigest(),
+        'simhash': f"{simhash(content):016x}"
+    }
+    if rule_result.get('is_hanoi_related') and not summarize:
+        event['_summary_input'] = (title, content)
+    
+    # Có LLM: không gọi ở đây (giữ fetch worker rảnh) - event chờ LLMStage quyết định
     if OPENAI_AVAILABLE:
-        llm_result = extract_with_llm(title, content)
-        if llm_result and llm_result.get('is_hanoi_related'):
-            return {
-                'title': title,
-                'url': url,
-                'source': article_meta['source'],
-                'date': article_content['publish_date'],
-                'summary': llm_result['summary'],
-                'content_hash': hashlib.sha256(content.encode()).hexdigest()
-            }
+        event['_llm_input'] = {'title': title, 'content': content}
+        return event
     
-    # Enhanced rule-based extraction
-    rule_result = extract_with_rules(title, content)
-    if rule_result.get('is_hanoi_related'):
-        return {
-            'title': title,
-            'url': url,
-            'source': article_meta['source'],
-            'date': article_content['publish_date'],
-            'summary': rule_result['summary'],
-            'content_hash': hashlib.sha256(content.encode()).hexdigest()
-        }
+    if not rule_result.get('is_hanoi_related'):
+        METRICS.drop("not_hanoi", source=source)
+        return None
+    return event
 
-    return None
+# ====== LLM STAGE ======
+_llm_cache: Optional[LLMCache] = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMCache:
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache(LLM_CACHE_FILE)
+        return _llm_cache
+
+def llm_cache_key(event: Dict) -> str:
+    return LLMCache.make_key(LLM_MODEL, LLM_PROMPT_VERSION, event['content_hash'])
+
+def finalize_event(event: Dict, llm_result: Optional[Dict]) -> Optional[Dict]:
+    """
+    Chốt event đang chờ LLM: LLM nói liên quan Hà Nội → summary của LLM,
+    không thì summary rule-based (nếu rule thấy liên quan), không thì bỏ bài
+    """
+    event = {k: v for k, v in event.items() if k != '_llm_input'}
+    if llm_result and llm_result.get('is_hanoi_related') and llm_result.get('summary'):
+        event['summary'] = llm_result['summary']
+    elif event.get('summary') is None:
+        METRICS.drop("not_hanoi", source=event.get('source', ''))
+        return None
+    return event
+
+class LLMStage:
+    """
+    Stage LLM chạy song song với Phase 2: nhận event chờ (có '_llm_input') qua submit(),
+    gọi extract_with_llm trên thread pool riêng (token bucket LLM_RATE req/s), dùng cache trước,
+    rồi giao event đã chốt cho on_event. close() chờ hết và trả về các event đã nhận.
+    """
+
+    def __init__(self, on_event: Optional[Callable[[Dict], bool]], workers: int = LLM_WORKERS, rate: float = LLM_RATE):
+        self.on_event = on_event
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.bucket = TokenBucket(rate, burst=workers)
+        self.cache = get_llm_cache()
+        self.futures = []
+        self.events: List[Dict] = []
+        self.lock = threading.Lock()
+
+    def submit(self, event: Dict) -> bool:
+        if '_llm_input' not in event:
+            return self._deliver(event)
+        self.futures.append(self.pool.submit(self._run, event))
+        return True
+
+    def _deliver(self, event: Dict) -> bool:
+        if not accept_event(event, self.on_event):
+            return False
+        with self.lock:
+            self.events.append(event)
+        return True
+
+    def _run(self, event: Dict):
+        key = llm_cache_key(event)
+        result = self.cache.get(key)
+        METRICS.inc("llm_cache", result="hit" if result is not None else "miss")
+        if result is None:
+            self.bucket.acquire()
+            llm_input = event['_llm_input']
+            with METRICS.timer("llm_seconds"):
+                result = extract_with_llm(llm_input['title'], llm_input['content'])
+            if result is None:
+                METRICS.inc("llm_errors")
+            else:
+                self.cache.put(key, result)
+        
+        final = finalize_event(event, result)
+        if final and self._deliver(final):
+            logger.info(f"✓ LLM stage: {final['title'][:50]}...")
+
+    def close(self) -> List[Dict]:
+        for future in self.futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"LLM stage error: {e}")
+        self.pool.shutdown(wait=True)
+        stats = self.cache.stats()
+        logger.info(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses ({stats['entries']} entries)")
+        return self.events
 
-def process_article_safe(article_meta: Dict, existing_hashes: set) -> Optional[Dict]:
+def process_article_safe(article_meta: Dict, existing_hashes: Container, html: Optional[bytes] = None,
+                         summarize: bool = True) -> Optional[Dict]:
     """Wrapper để xử lý article an toàn trong thread"""
     try:
-        event = process_article(article_meta)
+        event = process_article(article_meta, html, summarize)
         if event:
             if event['content_hash'] not in existing_hashes:
                 return event
+            METRICS.drop("duplicate", source=article_meta.get('source', ''))
         return None
     except Exception as e:
+        METRICS.drop("error", source=article_meta.get('source', ''))
         logger.error(f"Error in thread processing {article_meta.get('url', 'unknown')}: {e}")
         return None
 
-def process_articles_parallel(article_urls: List[Dict], existing_events: List[Dict], max_workers: int = 8) -> List[Dict]:
-    """Process articles in parallel - increased to 8 workers for better performance"""
-    existing_hashes = {e.get('content_hash') for e in existing_events if e.get('content_hash')}
+def record_and_process(article_meta: Dict, existing_hashes: Container, html: bytes, truncated: bool) -> Optional[Dict]:
+    """record_fetched_article (gzip + ghi index) rồi process_article_safe - cả hai chạy trong parse pool, không chặn event loop"""
+    record_fetched_article(article_meta['url'], html, truncated)
+    return process_article_safe(article_meta, existing_hashes, html)
+
+def print_progress(completed: int, total: int, last_percent: int) -> int:
+    """Terminal progress (simple) - in mỗi 10%, trả về mốc % đã in"""
+    current_percent = (completed * 100) // total
+    if current_percent > last_percent and current_percent % 10 == 0:
+        print(f"  Progress: {current_percent}% ({completed}/{total})")
+        return current_percent
+    return last_percent
+
+def accept_event(event: Dict, on_event: Optional[Callable[[Dict], bool]]) -> bool:
+    """Giao event mới cho on_event (vd. EventStore.append) ngay khi xong; False nếu bị từ chối (trùng)"""
+    if on_event is None or on_event(event) is not False:
+        return True
+    METRICS.drop("duplicate", source=event.get('source', ''))
+    return False
+
+def process_articles_parallel(article_urls: List[Dict], existing_hashes: Container, max_workers: int = 8,
+                              on_event: Optional[Callable[[Dict], bool]] = None) -> List[Dict]:
+    """
+    Process articles in parallel - increased to 8 workers for better performance
+    existing_hashes: content_hash đã lưu (set hoặc EventStore); on_event: gọi cho mỗi event mới
+    """
     
     new_events = []
     completed = 0
@@ -489,225 +1534,749 @@ def process_articles_parallel(article_urls: List[Dict], existing_events: List[Di
     last_percent = 0
     
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Politeness theo host (token bucket trong fetch_url) - các host khác nhau chạy song song
         future_to_article = {
             executor.submit(process_article_safe, article, existing_hashes): article 
-            for article in article_urls
+            for article in interleave_by_host(article_urls)
         }
         
         for future in as_completed(future_to_article):
             completed += 1
             article = future_to_article[future]
             
-            # Terminal progress (simple)
-            current_percent = (completed * 100) // total
-            if current_percent > last_percent and current_percent % 10 == 0:
-                print(f"  Progress: {current_percent}% ({completed}/{total})")
-                last_percent = current_percent
+            last_percent = print_progress(completed, total, last_percent)
             
             try:
                 event = future.result()
-                if event:
+                if event and accept_event(event, on_event):
                     new_events.append(event)
                     logger.info(f"[{completed}/{total}] ✓ Crawled: {event['title'][:50]}...")
                 else:
                     logger.debug(f"[{completed}/{total}] Skipped: {article.get('url', 'unknown')}")
             except Exception as e:
                 logger.error(f"[{completed}/{total}] Error: {e}")
+    
+    return new_events
+
+async def _process_articles_async(article_urls: List[Dict], existing_hashes: Container,
+                                  max_inflight: int, per_host: int, parse_workers: int,
+                                  on_event: Optional[Callable[[Dict], bool]]) -> List[Dict]:
+    """Fetch bằng asyncio, parse (BeautifulSoup + summary) trên thread pool riêng"""
+    new_events = []
+    completed = 0
+    total = len(article_urls)
+    last_percent = 0
+    loop = asyncio.get_running_loop()
+
+    connector = aiohttp.TCPConnector(limit=max_inflight, limit_per_host=per_host, ttl_dns_cache=300)
+
+    with ThreadPoolExecutor(max_workers=parse_workers) as parse_pool:
+        async with aiohttp.ClientSession(connector=connector) as session:
+
+            async def handle(article: Dict):
+                html, truncated = await fetch_url_async(session, article['url'])
+                if html is None:
+                    METRICS.drop("fetch_failed", source=article['source'])
+                    return article, None
+                event = await loop.run_in_executor(
+                    parse_pool, record_and_process, article, existing_hashes, html, truncated
+                )
+                return article, event
+
+            tasks = [asyncio.ensure_future(handle(article)) for article in interleave_by_host(article_urls)]
+
+            for next_done in asyncio.as_completed(tasks):
+                completed += 1
+                last_percent = print_progress(completed, total, last_percent)
+
+                try:
+                    article, event = await next_done
+                    if event and accept_event(event, on_event):
+                        new_events.append(event)
+                        logger.info(f"[{completed}/{total}] ✓ Crawled: {event['title'][:50]}...")
+                    else:
+                        logger.debug(f"[{completed}/{total}] Skipped: {article.get('url', 'unknown')}")
+                except Exception as e:
+                    logger.error(f"[{completed}/{total}] Error: {e}")
+
+    return new_events
+
+def process_articles_async(article_urls: List[Dict], existing_hashes: Container, max_inflight: int = 200,
+                           per_host: int = 16, parse_workers: int = 8,
+                           on_event: Optional[Callable[[Dict], bool]] = None) -> List[Dict]:
+    """
+    Asyncio engine: giữ tới max_inflight request cùng lúc, tối đa per_host kết nối mỗi trang.
+    Fallback về process_articles_parallel nếu chưa cài aiohttp.
+    """
+    if not AIOHTTP_AVAILABLE:
+        logger.warning("⚠ aiohttp not installed - falling back to thread engine")
+        return process_articles_parallel(article_urls, existing_hashes, max_workers=parse_workers, on_event=on_event)
+
+    logger.info(f"Processing {len(article_urls)} articles (async, {max_inflight} in flight, {per_host} per host)...")
+    return asyncio.run(_process_articles_async(article_urls, existing_hashes, max_inflight, per_host, parse_workers, on_event))
+
+def fetch_article_html(url: str) -> Optional[bytes]:
+    """I/O stage: chỉ tải HTML thô (+ ghi frontier/cache), không parse"""
+    html, truncated = fetch_html(url)
+    if html is None:
+        return None
+    record_fetched_article(url, html, truncated)
+    return html
+
+# Số bài tối đa mỗi lần gửi sang parse process (tóm tắt cả lô bằng summarize_batch)
+PARSE_BATCH_SIZE = 16
+
+def init_parse_worker():
+    """Process con (fork) mang theo METRICS của cha - xóa để chỉ gửi về phần của mình"""
+    METRICS.reset()
+
+def parse_articles_worker(batch: List[Tuple[Dict, bytes]]) -> Tuple[List[Optional[Dict]], Dict]:
+    """
+    Parse stage (chạy trong process con): BeautifulSoup + extract_with_rules cho từng bài,
+    rồi tóm tắt cả lô một lần (summarize_events), không đụng mạng.
+    Trả về (events theo thứ tự batch, metrics delta) để process cha merge vào METRICS.
+    """
+    events = []
+    for article_meta, html in batch:
+        try:
+            event = process_article(article_meta, html, summarize=False)
+        except Exception as e:
+            METRICS.drop("error", source=article_meta.get('source', ''))
+            logger.error(f"Error in parse worker {article_meta.get('url', 'unknown')}: {e}")
+            event = None
+        events.append(event)
+    summarize_events(events)
+    return events, METRICS.drain()
+
+def process_articles_pipeline(article_urls: List[Dict], existing_hashes: Container, io_workers: int = 16,
+                              parse_workers: Optional[int] = None,
+                              on_event: Optional[Callable[[Dict], bool]] = None) -> List[Dict]:
+    """
+    Pipeline 2 tầng: thread I/O chỉ tải bytes, ProcessPoolExecutor parse song song theo số core
+    (tránh GIL - thêm thread I/O không còn tranh CPU với BeautifulSoup).
+    Bài tải xong được gom thành lô tới PARSE_BATCH_SIZE; lô được gửi ngay khi parse pool rảnh
+    hoặc đã hết bài đang tải, nên lúc tải chậm bài không phải chờ đủ lô.
+    """
+    parse_workers = parse_workers or os.cpu_count() or 1
+    new_events = []
+    completed = 0
+    total = len(article_urls)
+    last_percent = 0
+    
+    logger.info(f"Processing {total} articles (pipeline: {io_workers} I/O threads, {parse_workers} parse processes)...")
+    
+    with ThreadPoolExecutor(max_workers=io_workers) as io_pool, \
+            ProcessPoolExecutor(max_workers=parse_workers, initializer=init_parse_worker) as parse_pool:
+        fetch_futures = {
+            io_pool.submit(fetch_article_html, article['url']): article
+            for article in interleave_by_host(article_urls)
+        }
+        parse_futures = {}
+        pending = set(fetch_futures)
+        fetched: List[Tuple[Dict, bytes]] = []
+        
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            results: List[Tuple[Dict, Optional[Dict]]] = []
+            for future in done:
+                # Tải xong → gom vào lô chờ parse
+                if future in fetch_futures:
+                    article = fetch_futures.pop(future)
+                    try:
+                        html = future.result()
+                    except Exception as e:
+                        logger.error(f"Fetch error {article.get('url', 'unknown')}: {e}")
+                        html = None
+                    if html is not None:
+                        fetched.append((article, html))
+                        continue
+                    METRICS.drop("fetch_failed", source=article['source'])
+                    results.append((article, None))
+                else:
+                    batch = parse_futures.pop(future)
+                    try:
+                        events, delta = future.result()
+                        METRICS.merge(delta)
+                    except Exception as e:
+                        logger.error(f"Parse error ({len(batch)} articles): {e}")
+                        events = [None] * len(batch)
+                    results.extend(zip(batch, events))
+            
+            # Gửi lô: đủ PARSE_BATCH_SIZE, parse pool đang rảnh, hoặc không còn bài nào đang tải
+            while fetched and (len(fetched) >= PARSE_BATCH_SIZE or not parse_futures or not fetch_futures):
+                batch, fetched = fetched[:PARSE_BATCH_SIZE], fetched[PARSE_BATCH_SIZE:]
+                parse_future = parse_pool.submit(parse_articles_worker, batch)
+                parse_futures[parse_future] = [article for article, _ in batch]
+                pending.add(parse_future)
             
-            time.sleep(random.uniform(0.5, 1.0))
+            for article, event in results:
+                completed += 1
+                last_percent = print_progress(completed, total, last_percent)
+                if event and event['content_hash'] in existing_hashes:
+                    METRICS.drop("duplicate", source=article['source'])
+                elif event and accept_event(event, on_event):
+                    new_events.append(event)
+                    logger.info(f"[{completed}/{total}] ✓ Crawled: {event['title'][:50]}...")
+                else:
+                    logger.debug(f"[{completed}/{total}] Skipped: {article.get('url', 'unknown')}")
     
     return new_events
 
-def crawl_rss_feed(source: str, rss_urls: List[str], limit: int = 50) -> List[Dict]:
+def crawl_single_feed(source: str, rss_url: str, limit: int = 50, use_cache: bool = True) -> List[Dict]:
     """
-    Crawl RSS feed to get article URLs - lấy bài trong 24h gần nhất
-    FIXED: Better error handling and debug info + HTML fallback
-    INCREASED: limit to 50 articles per source
+    Crawl một RSS feed để lấy URL bài - lấy bài trong 24h gần nhất (tối đa `limit` bài)
+    CACHE: conditional GET (ETag/Last-Modified), bỏ qua parse khi 304 hoặc body không đổi
+           (khi đó chỉ trả lại bài lần trước chưa tải được). Bài đã tải được lọc sau bằng URL frontier.
+    Feed cache 'new_items': số entry chưa có ở lần parse trước ('listed') - 0 khi 304 / body không đổi / lỗi,
+    daemon dùng để chỉnh chu kỳ poll.
     """
     articles = []
     
-    # Try each RSS URL until one works
-    for rss_url in rss_urls:
-        try:
-            logger.info(f"Crawling RSS: {source} - {rss_url}")
-            
-            # Fetch RSS with proper headers
-            response = fetch_url(rss_url, timeout=10)
-            if not response:
-                logger.warning(f"  Failed to fetch RSS, trying next URL...")
+    try:
+        logger.info(f"Crawling RSS: {source} - {rss_url}")
+        
+        cached = get_feed_cache(rss_url) if use_cache else {}
+        update_feed_cache(rss_url, new_items=0)
+        conditional_headers = {}
+        if cached.get('etag'):
+            conditional_headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            conditional_headers['If-Modified-Since'] = cached['last_modified']
+        
+        # Fetch RSS with proper headers
+        with METRICS.timer("feed_fetch_seconds", source=source, feed=rss_url):
+            response = fetch_url(rss_url, timeout=10, headers=conditional_headers)
+        if not response:
+            METRICS.inc("feeds", source=source, result="failed")
+            logger.warning(f"  Failed to fetch RSS")
+            return articles
+        
+        checked_at = datetime.now().isoformat(timespec='seconds')
+        if response.status_code == 304:
+            METRICS.inc("feeds", source=source, result="not_modified")
+            update_feed_cache(rss_url, checked_at=checked_at)
+            articles = retry_pending(rss_url, cached)
+            logger.info(f"  Not modified (304), skipping parse ({len(articles)} unfetched articles to retry)")
+            return articles
+        
+        # Server không hỗ trợ validator nhưng nội dung y hệt lần trước
+        body_hash = hashlib.sha256(response.content).hexdigest()
+        if cached.get('body_hash') == body_hash:
+            METRICS.inc("feeds", source=source, result="unchanged")
+            update_feed_cache(rss_url, checked_at=checked_at)
+            articles = retry_pending(rss_url, cached)
+            logger.info(f"  Feed body unchanged, skipping parse ({len(articles)} unfetched articles to retry)")
+            return articles
+        METRICS.inc("feeds", source=source, result="parsed")
+        
+        # Check content type
+        content_type = response.headers.get('Content-Type', '').lower()
+        logger.info(f"  Content-Type: {content_type}")
+        
+        # If HTML returned instead of XML, skip this feed
+        if 'text/html' in content_type:
+            logger.warning(f"  Received HTML instead of XML/RSS")
+            return articles
+        
+        # Parse feed with sanitization
+        feed = feedparser.parse(
+            response.content,
+            sanitize_html=True,
+            resolve_relative_uris=True
+        )
+        
+        # DEBUG: Check feed status
+        logger.info(f"  Feed status: {feed.get('status', 'N/A')}")
+        logger.info(f"  Feed entries: {len(feed.entries)}")
+        
+        # Check for serious parsing errors only
+        if feed.bozo:
+            bozo_exception = str(feed.get('bozo_exception', 'Unknown'))
+            # Only warn for non-critical errors
+            if 'not well-formed' in bozo_exception or 'syntax error' in bozo_exception:
+                logger.warning(f"  XML syntax warning (may still work): {bozo_exception[:100]}")
+            else:
+                logger.warning(f"  Feed parsing warning: {bozo_exception[:100]}")
+        
+        # If no entries but feed parsed, it might be empty or filtered
+        if not feed.entries:
+            logger.warning(f"  No entries found (feed may be empty)")
+            return articles
+        
+        # Get cutoff time (24 hours ago)
+        cutoff_time = datetime.now() - timedelta(hours=24)
+        
+        processed_count = 0
+        for entry in feed.entries[:limit * 5]:  # Lấy nhiều hơn để lọc (5x)
+            try:
+                # Parse publish date with multiple fallbacks
+                pub_date = None
+                
+                # Try different date fields
+                if hasattr(entry, 'published_parsed') and entry.published_parsed:
+                    try:
+                        pub_date = datetime.fromtimestamp(calendar.timegm(entry.published_parsed))
+                    except (TypeError, ValueError):
+                        pass
+                
+                if not pub_date and hasattr(entry, 'updated_parsed') and entry.updated_parsed:
+                    try:
+                        pub_date = datetime.fromtimestamp(calendar.timegm(entry.updated_parsed))
+                    except (TypeError, ValueError):
+                        pass
+                
+                # If still no date, try string parsing
+                if not pub_date:
+                    for date_field in ['published', 'updated', 'date']:
+                        if hasattr(entry, date_field):
+                            date_str = getattr(entry, date_field)
+                            try:
+                                from dateutil import parser as date_parser
+                                pub_date = date_parser.parse(date_str)
+                                break
+                            except:
+                                pass
+                
+                # DEBUG: Log first few entries
+                if processed_count < 3:
+                    logger.debug(f"  Entry: {entry.get('title', 'No title')[:50]}...")
+                    logger.debug(f"    Date: {pub_date}")
+                    logger.debug(f"    Link: {entry.get('link', 'No link')}")
+                
+                processed_count += 1
+                
+                # Get link
+                link = entry.get('link', '')
+                title = entry.get('title', 'No title')
+                
+                if not link:
+                    continue
+                
+                # Mô tả + chuyên mục trong RSS, dùng cho prefilter_reason (không cần tải bài)
+                summary = HTML_TAG_PATTERN.sub(' ', entry.get('summary', '') or '')
+                tags = [tag.get('term', '') for tag in entry.get('tags', []) if tag.get('term')]
+                
+                # Lấy bài trong 24h gần nhất (hoặc không có ngày)
+                if pub_date and pub_date >= cutoff_time:
+                    articles.append({
+                        'url': link,
+                        'title': title,
+                        'source': source,
+                        'pub_date': pub_date,
+                        'summary': summary,
+                        'tags': tags
+                    })
+                elif not pub_date:
+                    # If no date, include it anyway (assume recent)
+                    articles.append({
+                        'url': link,
+                        'title': title,
+                        'source': source,
+                        'pub_date': datetime.now(),
+                        'summary': summary,
+                        'tags': tags
+                    })
+                
+                if len(articles) >= limit:
+                    break
+                    
+            except Exception as e:
+                logger.debug(f"  Error parsing entry: {e}")
                 continue
-            
-            # Check content type
-            content_type = response.headers.get('Content-Type', '').lower()
-            logger.info(f"  Content-Type: {content_type}")
-            
-            # If HTML returned instead of XML, skip to next URL
-            if 'text/html' in content_type:
-                logger.warning(f"  Received HTML instead of XML/RSS, trying next URL...")
+        
+        logger.info(f"  Processed {processed_count} entries, found {len(articles)} recent articles")
+        
+        previous = set(cached.get('listed', []))
+        listed = [canonicalize_url(a['url']) for a in articles]
+        update_feed_cache(
+            rss_url,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'),
+            body_hash=body_hash,
+            pending=[pending_entry(a) for a in articles],
+            listed=listed,
+            new_items=sum(1 for url in listed if url not in previous),
+            checked_at=checked_at
+        )
+        
+        if not articles:
+            logger.info(f"  No recent articles in {rss_url}")
+
+    except Exception as e:
+        logger.error(f"Error crawling RSS {source} ({rss_url}): {e}")
+    
+    return articles
+
+def prefilter_reason(article: Dict) -> Optional[str]:
+    """
+    Chấm nhanh entry RSS (title + summary + category), trả về lý do bỏ qua hoặc None (vẫn tải).
+    Chỉ bỏ bài rõ ràng không liên quan: không nhắc Hà Nội / quận huyện Hà Nội, không có từ khóa
+    sự cố, và nêu tỉnh/thành khác hoặc thuộc chuyên mục ngoài phạm vi.
+    Entry mơ hồ (không đủ thông tin) vẫn được tải như trước.
+    """
+    tags = article.get('tags') or []
+    text = ' '.join([article.get('title', ''), article.get('summary', ''), *tags]).lower()
+    if HANOI_PATTERN.search(text) or HANOI_DISTRICT_PATTERN.search(text):
+        return None
+    if INDICATOR_PATTERN.search(text):
+        return None
+    if OTHER_PROVINCE_PATTERN.search(text):
+        return 'other_province'
+    
+    section = urlparse(article['url']).path.strip('/').split('/')[0]
+    if section in OFF_TOPIC_SECTIONS or any(tag in OFF_TOPIC_CATEGORIES for tag in tags):
+        return 'off_topic'
+    return None
+
+def prefilter_articles(articles: List[Dict]) -> List[Dict]:
+    """Bỏ entry RSS rõ ràng không liên quan trước Phase 2 (ghi METRICS theo lý do, bỏ khỏi pending của feed)"""
+    kept = []
+    dropped = []
+    for article in articles:
+        reason = prefilter_reason(article)
+        if reason is None:
+            kept.append(article)
+            continue
+        dropped.append(article['url'])
+        METRICS.drop(f"prefilter_{reason}", source=article['source'])
+        logger.debug(f"Prefilter ({reason}): {article.get('title', '')[:60]} - {article['url']}")
+    drop_pending(dropped)
+    logger.info(f"Prefilter: {len(articles) - len(kept)} of {len(articles)} RSS entries skipped")
+    return kept
+
+def crawl_feeds(jobs: List[Tuple[str, str]], limit: int = 50, use_cache: bool = True,
+                max_workers: int = 16) -> Dict[Tuple[str, str], List[Dict]]:
+    """Crawl song song danh sách (source, rss_url), trả về {(source, rss_url): articles}"""
+    results = {}
+    if not jobs:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        future_to_job = {
+            executor.submit(crawl_single_feed, source, rss_url, limit, use_cache): (source, rss_url)
+            for source, rss_url in jobs
+        }
+        for future in as_completed(future_to_job):
+            results[future_to_job[future]] = future.result()
+    return results
+
+def collect_rss_feeds(sources: Dict, limit: int = 50, use_cache: bool = True,
+                      max_workers: int = 16) -> Tuple[List[Dict], Dict[str, int]]:
+    """
+    Crawl song song TẤT CẢ RSS của mọi nguồn (politeness do token bucket theo host lo),
+    gộp kết quả theo thứ tự SOURCES và khử trùng theo link.
+    Trả về (articles, {source: số bài})
+    """
+    jobs = [(source, rss_url) for source, config in sources.items() for rss_url in config['rss']]
+    results = crawl_feeds(jobs, limit=limit, use_cache=use_cache, max_workers=max_workers)
+    
+    articles = []
+    source_stats = {source: 0 for source in sources}
+    seen_links = set()
+    for job in jobs:
+        for article in results.get(job, []):
+            link = canonicalize_url(article['url'])
+            if link in seen_links:
                 continue
-            
-            # Parse feed with sanitization
-            feed = feedparser.parse(
-                response.content,
-                sanitize_html=True,
-                resolve_relative_uris=True
+            seen_links.add(link)
+            articles.append(article)
+            source_stats[job[0]] += 1
+    
+    for source, count in source_stats.items():
+        if count:
+            logger.info(f"✓ Found {count} articles from last 24h for {source}")
+        else:
+            logger.warning(f"✗ No articles found for {source} from any RSS URL")
+    
+    return articles, source_stats
+
+def crawl_rss_feed(source: str, rss_urls: List[str], limit: int = 50, use_cache: bool = True) -> List[Dict]:
+    """Crawl mọi RSS của một nguồn song song, gộp và khử trùng theo link"""
+    articles, _ = collect_rss_feeds({source: {'rss': rss_urls}}, limit=limit, use_cache=use_cache)
+    return articles
+
+def reextract_from_cache(output_file: Path, since_hours: Optional[float] = None,
+                         refetch_truncated: bool = False) -> List[Dict]:
+    """
+    Chạy lại extract_article_content → process_article trên HTML đã cache (không dùng mạng),
+    để thử nhanh thay đổi selector / NOISE_KEYWORDS / summarizer. Ghi kết quả ra output_file.
+    Trang lưu dạng truncated (dừng ở container lúc crawl) vẫn có head, h1 và container của plan
+    nên được trích xuất như thường; chỉ khi refetch_truncated (vd. đổi selector sang phần tử
+    nằm sau container) mới tải lại cả trang và ghi đè vào cache.
+    """
+    since = datetime.now() - timedelta(hours=since_hours) if since_hours else None
+    entries = iter_html_cache(since)
+    truncated_entries = [entry for entry in entries if entry.get('truncated')]
+    network = f"refetching {len(truncated_entries)} truncated" if refetch_truncated else "no network"
+    print(f"Re-extracting {len(entries)} cached pages ({network})...")
+    logger.info(f"Re-extract: {len(entries)} cached pages from {HTML_CACHE_DIR}, {len(truncated_entries)} truncated")
+    for entry in truncated_entries:
+        logger.info(f"  truncated copy: {entry['url']}")
+    
+    parsed = []
+    seen_hashes = set()
+    started = time.time()
+    refetched = 0
+    for entry in entries:
+        html = None
+        if refetch_truncated and entry.get('truncated'):
+            html, truncated = fetch_html(entry['url'], stop_early=False)
+            if html is not None:
+                refetched += 1
+                record_fetched_article(entry['url'], html, truncated)
+            else:
+                logger.warning(f"Could not refetch full page for {entry['url']}, using truncated copy")
+        try:
+            if html is None:
+                html = load_cached_html(entry['sha256'])
+        except OSError as e:
+            logger.warning(f"Missing cached HTML for {entry['url']}: {e}")
+            continue
+        article_meta = {
+            'url': entry['url'],
+            'source': entry.get('source') or HOST_SOURCES.get(get_host(entry['url']), ''),
+        }
+        event = process_article_safe(article_meta, seen_hashes, html, summarize=False)
+        if event:
+            seen_hashes.add(event['content_hash'])
+            parsed.append(event)
+    
+    # Có sẵn mọi bài → tóm tắt cả lô một lần
+    summarize_events(parsed)
+    events = []
+    for event in parsed:
+        if '_llm_input' in event:
+            # Không gọi mạng: chỉ dùng kết quả LLM đã cache
+            event = finalize_event(event, get_llm_cache().get(llm_cache_key(event)))
+        if event:
+            events.append(event)
+    
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(events, f, ensure_ascii=False, indent=2)
+    
+    elapsed = time.time() - started
+    if refetched:
+        print(f"  ({refetched} truncated pages refetched in full and re-cached)")
+    elif truncated_entries:
+        print(f"  ({len(truncated_entries)} pages are truncated copies - see crawler.log, --refetch-truncated to reload them)")
+    print(f"✓ {len(events)} events from {len(entries)} pages in {elapsed:.1f}s → {output_file}")
+    logger.info(f"Re-extract finished: {len(events)} events in {elapsed:.1f}s")
+    return events
+
+def run_phase2(args, article_urls: List[Dict], existing_hashes: Container,
+               on_event: Callable[[Dict], bool]) -> List[Dict]:
+    """Chạy Phase 2 với engine chọn trên dòng lệnh (có OpenAI: event đi qua LLMStage trước khi vào kho)"""
+    stage = LLMStage(on_event) if OPENAI_AVAILABLE else None
+    if stage:
+        on_event = stage.submit
+    with METRICS.phase("articles") as phase:
+        if args.engine == "async":
+            new_events = process_articles_async(
+                article_urls, existing_hashes,
+                max_inflight=args.max_inflight, per_host=args.per_host, parse_workers=args.workers,
+                on_event=on_event
             )
-            
-            # DEBUG: Check feed status
-            logger.info(f"  Feed status: {feed.get('status', 'N/A')}")
-            logger.info(f"  Feed entries: {len(feed.entries)}")
-            
-            # Check for serious parsing errors only
-            if feed.bozo:
-                bozo_exception = str(feed.get('bozo_exception', 'Unknown'))
-                # Only warn for non-critical errors
-                if 'not well-formed' in bozo_exception or 'syntax error' in bozo_exception:
-                    logger.warning(f"  XML syntax warning (may still work): {bozo_exception[:100]}")
-                else:
-                    logger.warning(f"  Feed parsing warning: {bozo_exception[:100]}")
-            
-            # If no entries but feed parsed, it might be empty or filtered
-            if not feed.entries:
-                logger.warning(f"  No entries found (feed may be empty), trying next URL...")
+        elif args.engine == "pipeline":
+            new_events = process_articles_pipeline(
+                article_urls, existing_hashes,
+                io_workers=args.workers, parse_workers=args.parse_workers, on_event=on_event
+            )
+        else:
+            new_events = process_articles_parallel(article_urls, existing_hashes, max_workers=args.workers, on_event=on_event)
+        if stage:
+            new_events = stage.close()
+        phase['items'] = len(article_urls)
+    METRICS.inc("new_events", len(new_events))
+    return new_events
+
+def next_poll_interval(interval: float, new_items: int, min_interval: float = POLL_MIN_INTERVAL,
+                       max_interval: float = POLL_MAX_INTERVAL) -> float:
+    """Feed ra bài mới → poll dày hơn, feed im → giãn ra"""
+    factor = POLL_SHRINK if new_items else POLL_GROW
+    return min(max_interval, max(min_interval, interval * factor))
+
+def due_feeds(sources: Dict, now: float) -> List[Tuple[str, str]]:
+    """(source, rss_url) đã tới hạn poll (feed chưa có lịch → poll ngay)"""
+    return [
+        (source, rss_url)
+        for source, config in sources.items() for rss_url in config['rss']
+        if get_feed_cache(rss_url).get('next_poll', 0) <= now
+    ]
+
+def run_daemon(args, store: EventStore, store_event: Callable[[Dict], bool], near_dups: NearDupIndex):
+    """
+    --daemon: chạy liên tục, poll từng feed theo chu kỳ riêng (thích nghi theo tần suất ra bài),
+    bài mới đi thẳng vào Phase 2 + kho event. Lưu cache / frontier / metrics sau mỗi vòng.
+    Mỗi vòng cũng bỏ URL quá FRONTIER_RETENTION_DAYS và simhash quá cửa sổ near-dup,
+    để state của daemon chạy lâu không phình mãi.
+    Dừng bằng Ctrl+C hoặc SIGTERM (xong vòng hiện tại mới thoát).
+    """
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    min_interval, max_interval = args.poll_min, args.poll_max
+    print(f"Daemon mode: polling {sum(len(c['rss']) for c in SOURCES.values())} feeds "
+          f"every {min_interval:.0f}-{max_interval:.0f}s (Ctrl+C to stop)")
+    logger.info(f"Daemon mode: poll interval {min_interval}-{max_interval}s, engine={args.engine}")
+    
+    try:
+        while not stop.is_set():
+            jobs = due_feeds(SOURCES, time.time())
+            if not jobs:
+                next_at = min(get_feed_cache(rss_url).get('next_poll', 0)
+                              for config in SOURCES.values() for rss_url in config['rss'])
+                stop.wait(max(1.0, next_at - time.time()))
                 continue
             
-            # Get cutoff time (24 hours ago)
-            cutoff_time = datetime.now() - timedelta(hours=24)
-            
-            processed_count = 0
-            for entry in feed.entries[:limit * 5]:  # Lấy nhiều hơn để lọc (5x)
-                try:
-                    # Parse publish date with multiple fallbacks
-                    pub_date = None
-                    
-                    # Try different date fields
-                    if hasattr(entry, 'published_parsed') and entry.published_parsed:
-                        try:
-                            pub_date = datetime(*entry.published_parsed[:6])
-                        except (TypeError, ValueError):
-                            pass
-                    
-                    if not pub_date and hasattr(entry, 'updated_parsed') and entry.updated_parsed:
-                        try:
-                            pub_date = datetime(*entry.updated_parsed[:6])
-                        except (TypeError, ValueError):
-                            pass
-                    
-                    # If still no date, try string parsing
-                    if not pub_date:
-                        for date_field in ['published', 'updated', 'date']:
-                            if hasattr(entry, date_field):
-                                date_str = getattr(entry, date_field)
-                                try:
-                                    from dateutil import parser as date_parser
-                                    pub_date = date_parser.parse(date_str)
-                                    break
-                                except:
-                                    pass
-                    
-                    # DEBUG: Log first few entries
-                    if processed_count < 3:
-                        logger.debug(f"  Entry: {entry.get('title', 'No title')[:50]}...")
-                        logger.debug(f"    Date: {pub_date}")
-                        logger.debug(f"    Link: {entry.get('link', 'No link')}")
-                    
-                    processed_count += 1
-                    
-                    # Get link
-                    link = entry.get('link', '')
-                    title = entry.get('title', 'No title')
-                    
-                    if not link:
-                        continue
-                    
-                    # Lấy bài trong 24h gần nhất (hoặc không có ngày)
-                    if pub_date and pub_date >= cutoff_time:
-                        articles.append({
-                            'url': link,
-                            'title': title,
-                            'source': source,
-                            'pub_date': pub_date
-                        })
-                    elif not pub_date:
-                        # If no date, include it anyway (assume recent)
-                        articles.append({
-                            'url': link,
-                            'title': title,
-                            'source': source,
-                            'pub_date': datetime.now()
-                        })
-                    
-                    if len(articles) >= limit:
-                        break
-                        
-                except Exception as e:
-                    logger.debug(f"  Error parsing entry: {e}")
-                    continue
+            with METRICS.phase("rss") as phase:
+                results = crawl_feeds(jobs, limit=args.limit)
+                phase['items'] = sum(len(articles) for articles in results.values())
             
-            logger.info(f"  Processed {processed_count} entries, found {len(articles)} recent articles")
+            polled_at = time.time()
+            for source, rss_url in results:
+                # Chỉ entry mới so với lần parse trước mới tính là feed có bài mới
+                # (bài retry / bị prefilter bỏ không làm feed poll dày lên)
+                cached = get_feed_cache(rss_url)
+                interval = next_poll_interval(
+                    cached.get('poll_interval', POLL_DEFAULT_INTERVAL), cached.get('new_items', 0),
+                    min_interval, max_interval
+                )
+                update_feed_cache(rss_url, poll_interval=interval, next_poll=polled_at + interval)
             
-            # If we got articles, no need to try other URLs
+            articles = filter_unseen([a for batch in results.values() for a in batch], recheck_hours=args.recheck_hours)
+            if not args.no_prefilter:
+                articles = prefilter_articles(articles)
+            new_events = []
             if articles:
-                logger.info(f"✓ Found {len(articles)} articles from last 24h for {source}")
-                break
-            else:
-                logger.warning(f"  No recent articles found, trying next URL...")
+                new_events = run_phase2(args, articles, store, store_event)
                 
-        except Exception as e:
-            logger.error(f"Error crawling RSS {source} ({rss_url}): {e}")
-            continue
-    
-    # Final result
-    if not articles:
-        logger.warning(f"✗ No articles found for {source} from any RSS URL")
+                # Độ trễ từ lúc báo đăng tới lúc event vào kho
+                published = {a['url']: a['pub_date'] for a in articles if a.get('pub_date')}
+                stored_at = datetime.now()
+                for event in new_events:
+                    if event['url'] in published:
+                        METRICS.observe("publish_to_store_seconds",
+                                        (stored_at - published[event['url']]).total_seconds(), source=event['source'])
+            
+            expired_urls = prune_url_frontier()
+            expired_hashes = near_dups.prune()
+            if expired_urls or expired_hashes:
+                logger.info(f"Pruned {expired_urls} frontier URLs, {expired_hashes} near-dup entries")
+            save_feed_cache()
+            save_url_frontier()
+            write_metrics()
+            METRICS.reset()     # mỗi file metrics = 1 vòng poll
+            
+            logger.info(f"Daemon cycle: {len(jobs)} feeds polled, {len(articles)} new articles, "
+                        f"{len(new_events)} new events (total {len(store)})")
+            if new_events:
+                print(f"[{datetime.now():%H:%M:%S}] +{len(new_events)} events from {len(jobs)} feeds (total {len(store)})")
+    except KeyboardInterrupt:
+        print("\nStopping daemon...")
+    finally:
+        save_feed_cache()
+        save_url_frontier()
+        logger.info("Daemon stopped")
+
+def write_metrics():
+    """Ghi Data/metrics (JSON + Prometheus textfile) và tóm tắt nguồn chậm / lý do loại bài vào log"""
+    try:
+        json_path, prom_path = METRICS.write(METRICS_DIR)
+    except OSError as e:
+        logger.warning(f"Could not write metrics to {METRICS_DIR}: {e}")
+        return
     
-    return articles
+    report = METRICS.to_dict()
+    logger.info("Metrics summary:")
+    for name, stats in report['phases'].items():
+        logger.info(f"  phase {name}: {stats['items']} items in {stats['seconds']}s ({stats['per_second']}/s)")
+    for entry in sorted(report['histograms'].get('article_fetch_seconds', []), key=lambda e: -e['p50']):
+        logger.info(f"  fetch {entry['labels']['source']}: p50={entry['p50']}s p99={entry['p99']}s (n={entry['count']})")
+    for entry in report['counters'].get('dropped_articles', []):
+        logger.info(f"  dropped {entry['labels']['reason']} ({entry['labels'].get('source', '')}): {entry['value']:g}")
+    logger.info(f"Metrics written to {json_path} and {prom_path}")
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="SafeMap crawler: RSS → bài báo → trích xuất")
+    ap.add_argument("--engine", choices=["thread", "async", "pipeline"], default="thread",
+                    help="Engine Phase 2: thread (ThreadPoolExecutor), async (aiohttp) hoặc pipeline "
+                         "(thread I/O + process pool parse)")
+    ap.add_argument("--workers", type=int, default=8,
+                    help="Số worker thread (fetch với engine thread/pipeline, parse với async)")
+    ap.add_argument("--parse-workers", type=int, default=None,
+                    help="Số process parse của engine pipeline (mặc định: số CPU)")
+    ap.add_argument("--max-inflight", type=int, default=200, help="Số request đồng thời tối đa (engine async)")
+    ap.add_argument("--per-host", type=int, default=16, help="Số kết nối đồng thời tối đa mỗi trang báo (engine async)")
+    ap.add_argument("--limit", type=int, default=50, help="Số bài tối đa lấy từ mỗi RSS feed")
+    ap.add_argument("--recheck-hours", type=float, default=None,
+                    help="Tải lại bài đã crawl nếu lần tải trước cũ hơn số giờ này (mặc định: không tải lại)")
+    ap.add_argument("--near-dup-distance", type=int, default=6,
+                    help="Khoảng cách Hamming SimHash tối đa để coi 2 bài là gần trùng (cùng nhóm)")
+    ap.add_argument("--export-json", action="store_true",
+                    help="Sau khi crawl, xuất toàn bộ kho event ra Data/safemap_data.json (định dạng mảng cũ)")
+    ap.add_argument("--no-html-cache", action="store_true", help="Không lưu HTML thô của bài vào Data/html_cache")
+    ap.add_argument("--reextract", action="store_true",
+                    help="Không crawl: chạy lại trích xuất trên HTML đã cache rồi ghi ra --reextract-out")
+    ap.add_argument("--reextract-out", default=str(DATA_DIR / "safemap_data.reextract.json"),
+                    help="File kết quả của --reextract")
+    ap.add_argument("--since-hours", type=float, default=None,
+                    help="--reextract: chỉ dùng trang tải trong N giờ gần nhất (mặc định: toàn bộ cache)")
+    ap.add_argument("--refetch-truncated", action="store_true",
+                    help="--reextract: tải lại đầy đủ (có dùng mạng) các trang chỉ lưu tới container body rồi ghi đè cache")
+    ap.add_argument("--daemon", action="store_true",
+                    help="Chạy liên tục: poll từng RSS theo chu kỳ riêng, bài mới xử lý và lưu ngay")
+    ap.add_argument("--poll-min", type=float, default=POLL_MIN_INTERVAL,
+                    help="--daemon: chu kỳ poll ngắn nhất của 1 feed (giây)")
+    ap.add_argument("--poll-max", type=float, default=POLL_MAX_INTERVAL,
+                    help="--daemon: chu kỳ poll dài nhất của 1 feed (giây)")
+    ap.add_argument("--no-prefilter", action="store_true",
+                    help="Tải mọi bài từ RSS, không lọc trước theo title/summary/chuyên mục")
+    ap.add_argument("--refresh-feeds", action="store_true",
+                    help="Bỏ qua cache ETag/Last-Modified, tải và parse lại toàn bộ RSS")
+    return ap.parse_args()
 
 def main():
     """Main crawler"""
+    global HTML_CACHE_ENABLED
+    args = parse_args()
+    HTML_CACHE_ENABLED = not args.no_html_cache
+    
+    if args.reextract:
+        reextract_from_cache(Path(args.reextract_out), since_hours=args.since_hours,
+                             refetch_truncated=args.refetch_truncated)
+        return
+
     print("="*60)
     print("SafeMap Crawler - Running...")
     print("="*60)
     print("✓ Logs: crawler.log")
-    print("✓ Output: safemap_data.json")
+    print("✓ Output: Data/events/ (append-only)")
     print("="*60 + "\n")
     
     logger.info("="*60)
     logger.info("SafeMap Crawler - Enhanced with RSS Debug")
     logger.info("="*60)
     
-    # Load existing events
-    existing_events = []
-    
-    # Thư mục dự án (SAFEMAP)
-    PROJECT_ROOT = Path(__file__).resolve().parents[1]   # ../ từ Xu_li_data
-
-    # Thư mục Data và các file đích
-    DATA_DIR = PROJECT_ROOT / "Data"
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-
-    output_file = DATA_DIR / "safemap_data.json"
-    LOG_FILE    = DATA_DIR / "crawler.log"
     
-    try:
-        with open(output_file, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-            if content:
-                existing_events = json.loads(content)
-            else:
-                logger.info("JSON file is empty, starting fresh")
-        logger.info(f"Loaded {len(existing_events)} existing events")
-    except FileNotFoundError:
-        logger.info("No existing data file, starting fresh")
-    except json.JSONDecodeError as e:
-        logger.warning(f"Invalid JSON in existing file: {e}. Starting fresh")
-        import shutil
-        backup_file = f"{output_file}.backup"
-        try:
-            shutil.copy(output_file, backup_file)
-            logger.info(f"Backed up corrupted file to {backup_file}")
-        except:
-            pass
+    # Kho event append-only (lần đầu tự chuyển dữ liệu từ safemap_data.json)
+    store = EventStore(EVENTS_DIR, legacy_file=LEGACY_OUTPUT_FILE)
+    logger.info(f"Event store: {len(store)} existing events in {EVENTS_DIR}")
+    
+    # Nhóm bài gần trùng giữa các nguồn, chỉ bài đại diện đi tiếp sang Gemini/geocode
+    near_dups = NearDupIndex(EVENTS_DIR / "simhash_index.jsonl", max_distance=args.near_dup_distance)
+    
+    def store_event(event: Dict) -> bool:
+        if event['content_hash'] in store:
+            return False
+        if event.get('simhash'):
+            near_dups.assign(event)
+        return store.append(event)
+    
+    load_feed_cache()
+    load_url_frontier()
+    
+    if args.daemon:
+        run_daemon(args, store, store_event, near_dups)
+        return
     
     # Collect URLs from RSS
     print("Phase 1: Collecting RSS feeds...")
@@ -715,14 +2284,9 @@ def main():
     logger.info("PHASE 1: Collecting URLs from RSS feeds")
     logger.info("="*60)
     
-    all_article_urls = []
-    source_stats = {}
-    
-    for source, config in SOURCES.items():
-        articles = crawl_rss_feed(source, config['rss'], limit=50)  # Increased to 50
-        all_article_urls.extend(articles)
-        source_stats[source] = len(articles)
-        time.sleep(1)  # Delay between sources
+    with METRICS.phase("rss") as phase:
+        all_article_urls, source_stats = collect_rss_feeds(SOURCES, limit=args.limit, use_cache=not args.refresh_feeds)
+        phase['items'] = len(all_article_urls)
     
     # Print summary to terminal (simplified)
     print(f"\n✓ Collected {len(all_article_urls)} articles from {len([c for c in source_stats.values() if c > 0])} sources")
@@ -736,36 +2300,64 @@ def main():
     logger.info("-"*60 + "\n")
     
     if not all_article_urls:
+        save_feed_cache()
+        write_metrics()
         print("✗ No articles collected! Check crawler.log for details.")
         logger.error("No articles collected! Check RSS URLs and network connection.")
         return
     
+    # Bỏ URL đã crawl trước khi tốn network/CPU
+    collected = len(all_article_urls)
+    all_article_urls = filter_unseen(all_article_urls, recheck_hours=args.recheck_hours)
+    METRICS.inc("already_crawled", collected - len(all_article_urls))
+    logger.info(f"URL frontier: {collected - len(all_article_urls)} known URLs skipped, {len(all_article_urls)} new")
+    print(f"✓ {len(all_article_urls)} new articles ({collected - len(all_article_urls)} already crawled)")
+    
+    if not args.no_prefilter:
+        candidates = len(all_article_urls)
+        all_article_urls = prefilter_articles(all_article_urls)
+        print(f"✓ Prefilter: {len(all_article_urls)} to fetch ({candidates - len(all_article_urls)} clearly off-topic)")
+    
+    if not all_article_urls:
+        save_feed_cache()
+        write_metrics()
+        print("✓ Nothing new to process.")
+        return
+    
     # Process articles in parallel
     print(f"\nPhase 2: Processing {len(all_article_urls)} articles...")
     logger.info("\n" + "="*60)
     logger.info("PHASE 2: Processing articles")
     logger.info("="*60)
     
-    new_events = process_articles_parallel(all_article_urls, existing_events, max_workers=8)
+    # Mỗi event mới được append vào kho ngay khi xử lý xong
+    new_events = run_phase2(args, all_article_urls, store, store_event)
     
-    # Merge and save
-    all_events = existing_events + new_events
+    if args.export_json:
+        exported = store.export_json(LEGACY_OUTPUT_FILE)
+        logger.info(f"Exported {exported} events to {LEGACY_OUTPUT_FILE}")
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_events, f, ensure_ascii=False, indent=2)
+    # Lưu validator sau khi Phase 2 xong; bài chưa tải được vẫn nằm trong pending của feed cache
+    save_feed_cache()
+    save_url_frontier()
+    # Chạy một lần / cron: viết gọn simhash_index.jsonl (bỏ bài quá cửa sổ) để lần sau nạp nhanh
+    near_dups.prune()
+    write_metrics()
     
     # Terminal summary (simple)
     print(f"\n{'='*60}")
     print(f"✓ Finished!")
     print(f"  New events: {len(new_events)}")
-    print(f"  Total events: {len(all_events)}")
-    print(f"  Saved to: {output_file}")
+    print(f"  Near-duplicates: {sum(1 for e in new_events if e.get('is_representative') is False)}")
+    print(f"  Total events: {len(store)}")
+    print(f"  Saved to: {EVENTS_DIR}")
+    print(f"  Metrics: {METRICS_DIR}")
     print(f"{'='*60}\n")
     
     # Detailed log
     logger.info("\n" + "="*60)
     logger.info(f"Finished: {len(new_events)} new events added")
-    logger.info(f"Total events: {len(all_events)}")
+    logger.info(f"Total events: {len(store)}")
     logger.info("="*60)
 
 if __name__ == "__main__":
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+crawl_metrics.py
+Số liệu có cấu trúc cho mỗi lần chạy crawl.py, để biết trang nào / giai đoạn nào giới hạn tốc độ.
+
+- Counter: bytes / retry theo host, số bài bị loại theo lý do (short_content, not_hanoi, duplicate...)
+- Histogram: thời gian tải theo nguồn và theo feed, thời gian parse mỗi bài
+  (giữ mẫu thô để tính p50/p99 trong file JSON, bucket cố định cho Prometheus)
+- Phase: thời gian + số bài mỗi giai đoạn → bài/giây
+
+Ghi ra:
+Data/metrics/
+├── crawl_metrics.json   ← lần chạy gần nhất (đọc bằng mắt / script)
+└── crawl.prom           ← Prometheus textfile (node_exporter --collector.textfile.directory)
+
+Process con (engine pipeline) có METRICS riêng: gọi drain() để lấy phần tăng thêm,
+trả về cùng kết quả cho process cha merge().
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+import json
+import math
+import threading
+import time
+
+METRIC_PREFIX = "safemap_crawl_"
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+def _key(name: str, labels: Dict) -> LabelKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentile kiểu nearest-rank trên list đã sort"""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = ['%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class CrawlMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters: Dict[LabelKey, float] = {}
+            self.samples: Dict[LabelKey, List[float]] = {}
+            self.phases: Dict[str, Dict] = {}
+            self.started = time.time()
+
+    # ====== GHI NHẬN ======
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.samples.setdefault(key, []).append(value)
+
+    def drop(self, reason: str, **labels):
+        """Một bài bị loại - reason: fetch_failed, short_content, not_hanoi, duplicate..."""
+        self.inc("dropped_articles", reason=reason, **labels)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[Dict]:
+        """with METRICS.phase("rss") as ph: ...; ph["items"] = số bài xử lý được"""
+        stats = {"items": 0}
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                total = self.phases.setdefault(name, {"seconds": 0.0, "items": 0})
+                total["seconds"] += seconds
+                total["items"] += stats["items"]
+
+    # ====== GỘP TỪ PROCESS CON ======
+    def drain(self) -> Dict:
+        """Lấy toàn bộ số liệu hiện có rồi xóa (dùng trong process con)"""
+        with self.lock:
+            delta = {"counters": self.counters, "samples": self.samples}
+            self.counters, self.samples = {}, {}
+        return delta
+
+    def merge(self, delta: Dict):
+        with self.lock:
+            for key, value in delta.get("counters", {}).items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, values in delta.get("samples", {}).items():
+                self.samples.setdefault(key, []).extend(values)
+
+    # ====== XUẤT ======
+    def to_dict(self) -> Dict:
+        with self.lock:
+            counters = dict(self.counters)
+            samples = {key: sorted(values) for key, values in self.samples.items()}
+            phases = {name: dict(stats) for name, stats in self.phases.items()}
+
+        histograms: Dict[str, List[Dict]] = {}
+        for (name, labels), values in sorted(samples.items()):
+            histograms.setdefault(name, []).append({
+                "labels": dict(labels),
+                "count": len(values),
+                "sum": round(sum(values), 4),
+                "p50": round(percentile(values, 0.50), 4),
+                "p99": round(percentile(values, 0.99), 4),
+                "max": round(values[-1], 4) if values else 0.0,
+            })
+
+        counter_list: Dict[str, List[Dict]] = {}
+        for (name, labels), value in sorted(counters.items()):
+            counter_list.setdefault(name, []).append({"labels": dict(labels), "value": value})
+
+        for stats in phases.values():
+            stats["seconds"] = round(stats["seconds"], 3)
+            stats["per_second"] = round(stats["items"] / stats["seconds"], 2) if stats["seconds"] else 0.0
+
+        return {
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "run_seconds": round(time.time() - self.started, 3),
+            "phases": phases,
+            "counters": counter_list,
+            "histograms": histograms,
+        }
+
+    def to_prometheus(self) -> str:
+        with self.lock:
+            counters = dict(self.counters)
+            samples = {key: list(values) for key, values in self.samples.items()}
+            phases = {name: dict(stats) for name, stats in self.phases.items()}
+
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            metric = f"{METRIC_PREFIX}{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+
+        for (name, labels), values in sorted(samples.items()):
+            metric = f"{METRIC_PREFIX}{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            for bound in LATENCY_BUCKETS:
+                count = sum(1 for v in values if v <= bound)
+                le = 'le="%g"' % bound
+                lines.append(f"{metric}_bucket{_format_labels(labels, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{metric}_bucket{_format_labels(labels, le)} {len(values)}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {sum(values):.6f}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {len(values)}")
+
+        # Mỗi metric family phải liền khối trong textfile → 2 vòng riêng
+        if phases:
+            lines.append(f"# TYPE {METRIC_PREFIX}phase_seconds gauge")
+            for name, stats in sorted(phases.items()):
+                lines.append(f"{METRIC_PREFIX}phase_seconds{_format_labels((('phase', name),))} {stats['seconds']:.3f}")
+            lines.append(f"# TYPE {METRIC_PREFIX}phase_items_per_second gauge")
+            for name, stats in sorted(phases.items()):
+                rate = stats["items"] / stats["seconds"] if stats["seconds"] else 0.0
+                lines.append(f"{METRIC_PREFIX}phase_items_per_second{_format_labels((('phase', name),))} {rate:.3f}")
+
+        lines.append(f"# TYPE {METRIC_PREFIX}last_run_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}last_run_timestamp_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, metrics_dir: Path) -> Tuple[Path, Path]:
+        """Ghi crawl_metrics.json + crawl.prom (tmp rồi replace để reader không đọc file dở)"""
+        metrics_dir = Path(metrics_dir)
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        json_path = metrics_dir / "crawl_metrics.json"
+        prom_path = metrics_dir / "crawl.prom"
+        for path, text in (
+            (json_path, json.dumps(self.to_dict(), ensure_ascii=False, indent=2)),
+            (prom_path, self.to_prometheus()),
+        ):
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            tmp_path.write_text(text, encoding="utf-8")
+            tmp_path.replace(path)
+        return json_path, prom_path
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+event_store.py
+Kho sự kiện append-only dùng chung cho crawl.py (ghi) và APItest2.py (đọc).
+
+Cấu trúc:
+Data/events/
+├── events-YYYYMMDD.jsonl   ← mỗi dòng 1 event, chỉ append (1 segment / ngày)
+├── events-00000000.jsonl   ← dữ liệu chuyển từ safemap_data.json cũ (nếu có)
+└── hash_index.txt          ← content_hash đã lưu, mỗi dòng 1 hash
+
+Thêm event chỉ append 1 dòng vào segment + 1 dòng vào index, kiểm tra trùng
+bằng set hash trong bộ nhớ → không phụ thuộc tổng số event đã có.
+"""
+
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+import json
+import threading
+
+LEGACY_SEGMENT = "events-00000000.jsonl"
+
+class EventStore:
+    def __init__(self, root: Path, legacy_file: Optional[Path] = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.root / "hash_index.txt"
+        self.lock = threading.Lock()
+
+        if legacy_file is not None and not self.segments():
+            self._import_legacy(Path(legacy_file))
+
+        self.hashes = self._load_index()
+
+    # ====== ĐỌC ======
+    def segments(self) -> List[Path]:
+        return sorted(self.root.glob("events-*.jsonl"))
+
+    def iter_events(self) -> Iterator[Dict]:
+        """Duyệt mọi event theo thứ tự ghi (segment cũ → mới)"""
+        for segment in self.segments():
+            with segment.open("r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # Dòng cuối bị cắt dở (crash khi đang ghi) - bỏ qua
+                        continue
+
+    def __contains__(self, content_hash) -> bool:
+        return content_hash in self.hashes
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    # ====== GHI ======
+    def append(self, event: Dict) -> bool:
+        """Append 1 event; trả về False nếu content_hash đã có trong kho"""
+        content_hash = event.get("content_hash")
+        line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+        segment = self.root / f"events-{datetime.now():%Y%m%d}.jsonl"
+        with self.lock:
+            if content_hash and content_hash in self.hashes:
+                return False
+            with segment.open("a", encoding="utf-8") as f:
+                f.write(line)
+            if content_hash:
+                with self.index_file.open("a", encoding="utf-8") as f:
+                    f.write(content_hash + "\n")
+                self.hashes.add(content_hash)
+        return True
+
+    def export_json(self, path: Path) -> int:
+        """Ghi toàn bộ kho ra 1 file JSON mảng (định dạng safemap_data.json cũ)"""
+        count = 0
+        tmp_path = Path(path).with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            f.write("[\n")
+            for event in self.iter_events():
+                if count:
+                    f.write(",\n")
+                f.write(json.dumps(event, ensure_ascii=False, indent=2, default=str))
+                count += 1
+            f.write("\n]\n")
+        tmp_path.replace(path)
+        return count
+
+    # ====== NỘI BỘ ======
+    def _load_index(self) -> set:
+        if not self.index_file.exists():
+            # Chưa có index (hoặc bị xóa) → dựng lại từ segment
+            hashes = {e["content_hash"] for e in self.iter_events() if e.get("content_hash")}
+            with self.index_file.open("w", encoding="utf-8") as f:
+                f.writelines(h + "\n" for h in sorted(hashes))
+            return hashes
+        with self.index_file.open("r", encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def _import_legacy(self, legacy_file: Path):
+        """Chuyển safemap_data.json (mảng) sang segment đầu tiên, chỉ chạy 1 lần"""
+        try:
+            with legacy_file.open("r", encoding="utf-8") as f:
+                content = f.read().strip()
+            events = json.loads(content) if content else []
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError as e:
+            print(f"[CẢNH BÁO] {legacy_file} không phải JSON hợp lệ ({e}), bỏ qua khi chuyển dữ liệu")
+            return
+        if not isinstance(events, list) or not events:
+            return
+
+        seen = set()
+        with (self.root / LEGACY_SEGMENT).open("w", encoding="utf-8") as f:
+            for event in events:
+                if not isinstance(event, dict):
+                    continue
+                content_hash = event.get("content_hash")
+                if content_hash and content_hash in seen:
+                    continue
+                seen.add(content_hash)
+                f.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+def load_events(data_dir: Path, legacy_file: Optional[Path] = None) -> List[Dict]:
+    """
+    Đọc toàn bộ event của crawler: từ Data/events nếu đã có kho append-only,
+    không thì từ legacy_file (mảng JSON, mặc định Data/safemap_data.json) như trước.
+    """
+    data_dir = Path(data_dir)
+    events_dir = data_dir / "events"
+    if events_dir.exists() and any(events_dir.glob("events-*.jsonl")):
+        return list(EventStore(events_dir).iter_events())
+
+    legacy_file = Path(legacy_file) if legacy_file is not None else data_dir / "safemap_data.json"
+    with legacy_file.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError("File JSON phải là một mảng các object.")
+    return data
@@ -165,8 +165,9 @@ def main():
 
     for ln, obj in iter_jsonl(inp_path):
         idx = obj.get("index")
-        # Ưu tiên bản ghi đầu tiên theo index
-        if isinstance(idx, int) and idx not in by_index:
+        # Ưu tiên bản ghi mới nhất theo index: APItest2 ghi lại cùng index khi bài đổi nội dung
+        # hoặc khi gửi lại mục model bỏ sót (MODEL_MISSED)
+        if isinstance(idx, int):
             by_index[idx] = obj
 
         errs, warns = validate(obj)
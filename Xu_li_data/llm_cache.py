@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+llm_cache.py
+Cache kết quả gọi LLM lưu trên đĩa (append-only JSONL), để bài / sự kiện lặp lại không tốn thêm request.
+Dùng chung file Data/llm_cache.jsonl cho crawl.py (OpenAI extract), APItest2.py (phân loại từng sự cố)
+và process_markers.py (tóm tắt marker).
+
+- Khóa = sha256(model + phiên bản prompt + input đã chuẩn hóa khoảng trắng):
+  đổi model hoặc sửa prompt (tăng PROMPT_VERSION) → khóa mới, kết quả cũ không bị dùng nhầm.
+- Mỗi dòng: {"key", "value", "ts"}; dòng sau ghi đè dòng trước cùng khóa.
+- Chỉ cache kết quả hợp lệ (người gọi không put khi request lỗi).
+"""
+
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import re
+import threading
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+def normalize_input(text: str) -> str:
+    return WHITESPACE_PATTERN.sub(" ", text or "").strip()
+
+class LLMCache:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def make_key(model: str, prompt_version: str, text: str) -> str:
+        raw = "\x1f".join((model, prompt_version, normalize_input(text)))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self.entries[entry["key"]] = entry["value"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue    # dòng cuối bị cắt dở
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any):
+        line = json.dumps({
+            "key": key,
+            "value": value,
+            "ts": datetime.now().isoformat(timespec="seconds"),
+        }, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.entries[key] = value
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+near_dup.py
+Phát hiện bài gần trùng giữa các nguồn (VnExpress, Dân Trí, Tuổi Trẻ... đưa cùng một sự việc)
+bằng SimHash 64-bit trên shingle 3 từ của nội dung bài.
+
+- Mỗi event mới được gán nhóm: nếu có bài trong cửa sổ thời gian với khoảng cách Hamming
+  <= max_distance thì vào nhóm của bài đó (is_representative = False),
+  không thì tự lập nhóm mới và làm đại diện (is_representative = True).
+- Tra ứng viên qua banding: chia 64 bit thành (max_distance + 1) dải, hai simhash cách nhau
+  <= max_distance chắc chắn trùng ít nhất một dải (nguyên lý Dirichlet).
+- Index lưu append-only ở Data/events/simhash_index.jsonl, chỉ nạp các dòng trong cửa sổ;
+  prune() (daemon gọi mỗi vòng) bỏ bài quá cửa sổ khỏi bucket và viết gọn lại file.
+
+Bước sau (APItest2.py → Gemini, process_markers.py → geocode) chỉ xử lý bài đại diện.
+"""
+
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import re
+import threading
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def simhash(text: str, shingle_size: int = SHINGLE_SIZE) -> int:
+    """SimHash 64-bit của văn bản (shingle `shingle_size` từ, hash blake2b)"""
+    words = TOKEN_PATTERN.findall((text or "").lower())
+    if not words:
+        return 0
+    shingles = [" ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))]
+
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            if h >> bit & 1:
+                weights[bit] += 1
+            else:
+                weights[bit] -= 1
+
+    value = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            value |= 1 << bit
+    return value
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class NearDupIndex:
+    def __init__(self, index_file: Path, max_distance: int = 6, window_days: float = 3):
+        self.index_file = Path(index_file)
+        self.max_distance = max_distance
+        self.window = timedelta(days=window_days)
+        self.lock = threading.Lock()
+
+        # Dải bit cho banding: (max_distance + 1) dải gần bằng nhau phủ 64 bit
+        n_bands = max_distance + 1
+        edges = [round(i * SIMHASH_BITS / n_bands) for i in range(n_bands + 1)]
+        self.bands = [(edges[i], edges[i + 1] - edges[i]) for i in range(n_bands)]
+        # Mỗi bài có mặt ở mọi dải: (simhash, nhóm, thời điểm gán)
+        self.buckets: List[Dict[int, List[Tuple[int, str, datetime]]]] = [{} for _ in self.bands]
+        self.stale_lines = 0    # dòng quá cửa sổ còn nằm trong file (prune() sẽ viết gọn)
+
+        self._load()
+
+    def _band_keys(self, value: int) -> List[int]:
+        return [(value >> start) & ((1 << width) - 1) for start, width in self.bands]
+
+    def _add(self, value: int, group: str, ts: datetime):
+        for bucket, key in zip(self.buckets, self._band_keys(value)):
+            bucket.setdefault(key, []).append((value, group, ts))
+
+    def _load(self):
+        if not self.index_file.exists():
+            return
+        cutoff = datetime.now() - self.window
+        with self.index_file.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    ts = datetime.fromisoformat(entry["ts"])
+                    if ts < cutoff:
+                        self.stale_lines += 1
+                        continue
+                    self._add(int(entry["simhash"], 16), entry["group"], ts)
+                except (json.JSONDecodeError, KeyError, ValueError):
+                    self.stale_lines += 1
+                    continue
+
+    def prune(self) -> int:
+        """
+        Bỏ các bài quá cửa sổ khỏi bucket (daemon chạy lâu không phình bộ nhớ);
+        có gì bị bỏ thì viết lại file index chỉ với các bài còn trong cửa sổ. Trả về số bài đã bỏ.
+        """
+        cutoff = datetime.now() - self.window
+        with self.lock:
+            removed = 0
+            for band, bucket in enumerate(self.buckets):
+                for key in list(bucket):
+                    kept = [entry for entry in bucket[key] if entry[2] >= cutoff]
+                    if band == 0:
+                        removed += len(bucket[key]) - len(kept)
+                    if kept:
+                        bucket[key] = kept
+                    else:
+                        del bucket[key]
+            if (removed or self.stale_lines) and self.index_file.exists():
+                self._rewrite()
+            return removed
+
+    def _rewrite(self):
+        """Ghi lại index từ bucket của dải đầu (dải nào cũng chứa đủ mọi bài); gọi khi đang giữ lock"""
+        entries = sorted((entry for entries in self.buckets[0].values() for entry in entries), key=lambda e: e[2])
+        tmp_path = self.index_file.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            for value, group, ts in entries:
+                f.write(json.dumps({
+                    "simhash": f"{value:016x}",
+                    "group": group,
+                    "ts": ts.isoformat(timespec="seconds"),
+                }) + "\n")
+        os.replace(tmp_path, self.index_file)
+        self.stale_lines = 0
+
+    def find(self, value: int) -> Optional[str]:
+        """Nhóm của bài gần nhất trong ngưỡng, hoặc None"""
+        best = None
+        best_distance = self.max_distance + 1
+        for bucket, key in zip(self.buckets, self._band_keys(value)):
+            for other, group, _ in bucket.get(key, ()):
+                distance = hamming(value, other)
+                if distance < best_distance:
+                    best, best_distance = group, distance
+        return best
+
+    def assign(self, event: Dict) -> Dict:
+        """
+        Gán dup_group / is_representative cho event (cần 'simhash' dạng hex và 'content_hash'),
+        ghi vào index. Trả về chính event.
+        """
+        value = int(event["simhash"], 16)
+        with self.lock:
+            group = self.find(value)
+            event["is_representative"] = group is None
+            event["dup_group"] = group or event["content_hash"]
+            now = datetime.now().replace(microsecond=0)
+            self._add(value, event["dup_group"], now)
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            with self.index_file.open("a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "simhash": event["simhash"],
+                    "group": event["dup_group"],
+                    "ts": now.isoformat(timespec="seconds"),
+                }) + "\n")
+        return event
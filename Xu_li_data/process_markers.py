@@ -4,7 +4,8 @@
 """
 process_markers.py
 Đọc Data/ket_qua.valid.json (hoặc .jsonl), lọc valid=true, geocode location → (lat,lng),
-tóm tắt ngắn 'sự kiện' từ noi_dung (qua Gemini, fallback rule-based),
+tóm tắt ngắn 'sự kiện' từ noi_dung (qua Gemini, fallback rule-based; kết quả Gemini lưu cache
+Data/llm_cache.jsonl nên chạy lại không gọi lại API cho nội dung cũ),
 và ghi ra tao_map/data/processed_markers.json theo format yêu cầu.
 
 Cấu trúc dự án giả định:
@@ -26,6 +27,8 @@ import time
 import re
 import requests
 
+from llm_cache import LLMCache
+
 # ====== ĐƯỜNG DẪN MẶC ĐỊNH ======
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR     = PROJECT_ROOT / "Data"
@@ -82,24 +85,50 @@ def geocode_location(text: str, country_bias: str = "VN", sleep_sec: float = 1.0
     return (None, None)
 
 # ====== TÓM TẮT SỰ KIỆN ======
-def summarize_event_gemini(text: str, max_words: int = 12):
+GEMINI_MODEL = "gemini-2.5-flash"
+SUMMARY_PROMPT_VERSION = "summary-v1"   # tăng khi sửa prompt tóm tắt
+LLM_CACHE_FILE = DATA_DIR / "llm_cache.jsonl"
+
+_gemini_client = None
+_llm_cache = None
+
+def get_gemini_client():
+    """Tạo client 1 lần cho cả lần chạy (thay vì mỗi marker 1 client)"""
+    global _gemini_client
+    if _gemini_client is None:
+        from google import genai
+        _gemini_client = genai.Client()
+    return _gemini_client
+
+def get_llm_cache() -> LLMCache:
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMCache(LLM_CACHE_FILE)
+    return _llm_cache
+
+def summarize_event_gemini(text: str, max_words: int = 12, use_cache: bool = True):
     """
     Tóm tắt ngắn gọn bằng Google Gemini (google.genai).
     Trả về chuỗi <= ~max_words, fallback nếu lỗi hoặc SDK không có.
+    Kết quả Gemini được cache theo (model, prompt, max_words, nội dung); fallback thì không.
     """
     text = (text or "").strip()
     if not text:
         return ""
+    key = LLMCache.make_key(GEMINI_MODEL, f"{SUMMARY_PROMPT_VERSION}:{max_words}", text[:2000])
+    if use_cache:
+        cached = get_llm_cache().get(key)
+        if cached is not None:
+            return cached
     try:
-        from google import genai
         from google.genai import types
-        client = genai.Client()
+        client = get_gemini_client()
         prompt = (
             "Tóm tắt siêu ngắn (<= {n} từ) một mô tả sự cố/sự kiện, giữ trọng tâm, tiếng Việt, "
             "không thêm tiền tố: \n\n\"{content}\""
         ).format(n=max_words, content=text[:2000])
         resp = client.models.generate_content(
-            model="gemini-2.5-flash",
+            model=GEMINI_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
                 thinking_config=types.ThinkingConfig(thinking_budget=0),
@@ -113,6 +142,8 @@ def summarize_event_gemini(text: str, max_words: int = 12):
             out = " ".join(words[:max_words])
         # bỏ dấu ngoặc kép bao ngoài nếu có
         out = out.strip("“”\"'")
+        if out and use_cache:
+            get_llm_cache().put(key, out)
         return out
     except Exception:
         return summarize_event_fallback(text, max_words=max_words)
@@ -181,6 +212,7 @@ def main():
     ap.add_argument("--country", default="VN", help="Ưu tiên geocode trong country code (VD: VN)")
     ap.add_argument("--sleep", type=float, default=1.0, help="Delay giữa các lần gọi Nominatim (giây)")
     ap.add_argument("--max-words", type=int, default=12, help="Số từ tối đa cho tóm tắt sự kiện")
+    ap.add_argument("--no-cache", action="store_true", help="Không dùng cache LLM, gọi Gemini cho mọi marker")
     args = ap.parse_args()
 
     inp_path = Path(args.inp)
@@ -204,7 +236,7 @@ def main():
 
         # Tóm tắt “sự kiện” từ noi_dung (qua Gemini; fallback rule-based)
         noi_dung = obj.get("noi_dung", "")
-        su_kien  = summarize_event_gemini(noi_dung, max_words=args.max_words)
+        su_kien  = summarize_event_gemini(noi_dung, max_words=args.max_words, use_cache=not args.no_cache)
 
         # Map mức độ
         muc_goc = obj.get("muc_do_khan_cap")
@@ -222,6 +254,9 @@ def main():
         json.dump(markers, f, ensure_ascii=False, indent=2)
 
     print(f"✓ Đã tạo {len(markers)} marker → {out_path}")
+    if not args.no_cache:
+        stats = get_llm_cache().stats()
+        print(f"LLM cache: {stats['hits']} hit / {stats['misses']} miss ({stats['entries']} mục)")
 
 if __name__ == "__main__":
     main()
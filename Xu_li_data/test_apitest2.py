@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_apitest2.py
+Test offline cho phần phân loại theo batch của APItest2.py, dùng FakeClient thay google-genai (không cần mạng / API key).
+
+- FakeClient.models.generate_content_stream: dựng response từ seed_list trong prompt theo `responder`,
+  trả về từng mảnh nhỏ; mảnh cuối mang usage_metadata (như API thật), có thể bị ngắt giữa chừng.
+- FakeClient.caches.create luôn lỗi → kiểm tra fallback gửi system instruction kèm từng request.
+
+Chạy: python -m pytest -q test_apitest2.py   (hoặc python test_apitest2.py)
+"""
+
+import json
+import sys
+import tempfile
+import threading
+import time
+import types as pytypes
+import unittest
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+SEED_HEADER = "Danh sách sự cố (mảng JSON):\n"
+CHUNK_CHARS = 7
+
+# ====== Fake google-genai ======
+class StreamCut(ConnectionError):
+    """Stream bị ngắt giữa chừng (giống lỗi mạng khi đang đọc response)"""
+
+class ApiError(Exception):
+    def __init__(self, code: int):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+def answer(seed: Dict) -> Dict:
+    return {"index": seed["index"], "valid": True, "linh_vuc": ["Giao thông & Hạ tầng"],
+            "muc_do": "Thấp", "confidence": 0.9, "rationale": f'bài "{seed["noi_dung"]}" {{ok}} [1] \\ xong'}
+
+class FakeModels:
+    """
+    responder(seeds, call_no) → (text, cut): text là toàn bộ response của model;
+    cut=True → chỉ gửi nửa đầu text rồi ném StreamCut.
+    responder cũng có thể ném lỗi trước khi stream bắt đầu (vd. ApiError(429)).
+    """
+
+    def __init__(self):
+        self.responder: Callable[[List[Dict], int], Tuple[str, bool]] = lambda seeds, n: (json.dumps([answer(s) for s in seeds]), False)
+        self.calls: List[List[int]] = []
+        self.configs: List[Dict] = []
+
+    def generate_content_stream(self, model: str, contents: str, config: Dict):
+        seeds = json.loads(contents[contents.index(SEED_HEADER) + len(SEED_HEADER):])
+        self.calls.append([seed["index"] for seed in seeds])
+        self.configs.append(config)
+        text, cut = self.responder(seeds, len(self.calls))
+        return self._stream(text, cut, len(seeds))
+
+    def _stream(self, text: str, cut: bool, count: int):
+        if cut:
+            text = text[:len(text) // 2]
+        usage = pytypes.SimpleNamespace(prompt_token_count=100 + count, cached_content_token_count=0,
+                                        candidates_token_count=len(text), total_token_count=100 + count + len(text))
+        pieces = [text[i:i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS)] or [""]
+        for i, piece in enumerate(pieces):
+            last = i == len(pieces) - 1 and not cut
+            yield pytypes.SimpleNamespace(text=piece, usage_metadata=usage if last else None)
+        if cut:
+            raise StreamCut("connection reset")
+
+class FakeCaches:
+    def create(self, **kwargs):
+        raise ApiError(400)
+
+    def delete(self, **kwargs):
+        pass
+
+class FakeClient:
+    def __init__(self):
+        self.models = FakeModels()
+        self.caches = FakeCaches()
+
+def install_fake_genai():
+    google = pytypes.ModuleType("google")
+    genai = pytypes.ModuleType("google.genai")
+    genai_types = pytypes.ModuleType("google.genai.types")
+    genai.Client = FakeClient
+    for name in ("GenerateContentConfig", "ThinkingConfig", "CreateCachedContentConfig"):
+        setattr(genai_types, name, lambda **kwargs: kwargs)
+    genai.types = genai_types
+    google.genai = genai
+    sys.modules.update({"google": google, "google.genai": genai, "google.genai.types": genai_types})
+
+install_fake_genai()
+import APItest2 as A  # noqa: E402
+from llm_cache import LLMCache  # noqa: E402
+
+def make_items(count: int) -> List[Dict]:
+    return [{"index": i, "text": f"Va chạm xe máy tại phố số {i}", "event_id": f"e{i}", "fingerprint": f"f{i}"}
+            for i in range(1, count + 1)]
+
+# ====== JsonArrayStream ======
+class JsonArrayStreamTest(unittest.TestCase):
+    def feed_all(self, text: str, size: int) -> List[Dict]:
+        parser = A.JsonArrayStream()
+        objects = []
+        for i in range(0, len(text), size):
+            objects.extend(parser.feed(text[i:i + size]))
+        return objects
+
+    def test_objects_across_chunk_boundaries(self):
+        data = [{"a": 'x "}] {[', "b": [1, {"c": 2}]}, {"d": "\\"}, {"e": []}]
+        text = "```json\n" + json.dumps(data, ensure_ascii=False, indent=2) + "\n```"
+        for size in (1, 3, len(text)):
+            self.assertEqual(self.feed_all(text, size), data)
+
+    def test_emits_each_object_as_soon_as_it_closes(self):
+        parser = A.JsonArrayStream()
+        self.assertEqual(parser.feed('[{"a": 1}, {"b"'), [{"a": 1}])
+        self.assertEqual(parser.feed(': 2}'), [{"b": 2}])
+
+    def test_ignores_text_after_array_and_incomplete_tail(self):
+        self.assertEqual(self.feed_all('[{"a": 1}] {"b": 2}', 4), [{"a": 1}])
+        self.assertEqual(self.feed_all('[{"a": 1}, {"b": "cut', 4), [{"a": 1}])
+
+# ====== RateLimiter ======
+class RateLimiterTest(unittest.TestCase):
+    def test_rpm_blocks_until_window_slides(self):
+        limiter = A.RateLimiter(rpm=2, tpm=10_000, window=0.3)
+        started = time.monotonic()
+        for _ in range(3):
+            limiter.acquire(10)
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
+
+    def test_tpm_blocks_and_settle_releases(self):
+        limiter = A.RateLimiter(rpm=100, tpm=1_000, window=5.0)
+        entry = limiter.acquire(900)
+        acquired = threading.Event()
+        waiter = threading.Thread(target=lambda: (limiter.acquire(500), acquired.set()))
+        waiter.start()
+        self.assertFalse(acquired.wait(0.2))      # 900 + 500 > 1000 → phải chờ
+        limiter.settle(entry, 100)                # token thật ít hơn ước lượng → gửi được ngay
+        self.assertTrue(acquired.wait(1.0))
+        waiter.join()
+
+    def test_request_larger_than_quota_still_goes_through(self):
+        limiter = A.RateLimiter(rpm=10, tpm=1_000, window=5.0)
+        self.assertEqual(limiter.acquire(5_000)[1], 1_000)
+
+# ====== request_batch / classify_items với FakeClient ======
+class ClassifyTest(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeClient()
+        self.tmp = Path(tempfile.mkdtemp())
+        patches = [
+            mock.patch.object(A, "client", self.fake),
+            mock.patch.object(A, "CHECKPOINT_FILE", self.tmp / "checkpoint.json"),
+            mock.patch.object(A, "context_cache_name", None),
+            mock.patch.object(A.time, "sleep", lambda seconds: None),   # bỏ backoff khi retry
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.limiter = A.RateLimiter(rpm=1_000, tpm=10 ** 9)
+
+    def make_writer(self, cache: Optional[LLMCache] = None) -> "A.ResultWriter":
+        return A.ResultWriter(self.tmp / "ket_qua.jsonl", {"done": {}}, cache)
+
+    def written(self) -> List[Dict]:
+        path = self.tmp / "ket_qua.jsonl"
+        if not path.exists():
+            return []
+        return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+    # --- request_batch ---
+    def test_request_batch_streams_objects_and_settles_usage(self):
+        items = make_items(3)
+        seen = []
+        entries = []
+        acquire = self.limiter.acquire
+        self.limiter.acquire = lambda tokens: entries.append(acquire(tokens)) or entries[-1]
+        raw, usage = A.request_batch(items, self.limiter, seen.append)
+        self.assertEqual([obj["index"] for obj in seen], [1, 2, 3])
+        self.assertEqual(json.loads(raw), seen)
+        self.assertEqual(usage["requests"], 1)
+        self.assertEqual(usage["prompt"], 103)
+        self.assertEqual(entries[0][1], 103 + len(raw))        # ước lượng được thay bằng total_token_count
+        self.assertIn("system_instruction", self.fake.models.configs[0])
+
+    def test_request_batch_keeps_objects_when_stream_cut(self):
+        self.fake.models.responder = lambda seeds, n: (json.dumps([answer(s) for s in seeds]), True)
+        seen = []
+        raw, usage = A.request_batch(make_items(6), self.limiter, seen.append)
+        self.assertTrue(0 < len(seen) < 6)
+        self.assertEqual(len(self.fake.models.calls), 1)         # đã có object → không gửi lại cả batch
+        self.assertEqual(usage["prompt"], 0)                     # stream đứt trước mảnh mang usage
+
+    def test_request_batch_retries_retryable_error_before_any_object(self):
+        def responder(seeds, n):
+            if n == 1:
+                raise ApiError(429)
+            return json.dumps([answer(s) for s in seeds]), False
+        self.fake.models.responder = responder
+        seen = []
+        A.request_batch(make_items(2), self.limiter, seen.append)
+        self.assertEqual(len(self.fake.models.calls), 2)
+        self.assertEqual(len(seen), 2)
+
+    def test_request_batch_raises_non_retryable_error(self):
+        def responder(seeds, n):
+            raise ApiError(400)
+        self.fake.models.responder = responder
+        with self.assertRaises(ApiError):
+            A.request_batch(make_items(2), self.limiter, lambda obj: None)
+        self.assertEqual(len(self.fake.models.calls), 1)
+
+    # --- classify_items ---
+    def test_stream_cut_resends_only_missing_items(self):
+        self.fake.models.responder = lambda seeds, n: (json.dumps([answer(s) for s in seeds]), n == 1)
+        writer = self.make_writer()
+        results, bad, usage = A.classify_items(make_items(8), self.limiter, writer)
+        calls = self.fake.models.calls
+        self.assertEqual(sorted(results), list(range(1, 9)))
+        self.assertEqual(len(calls), 2)
+        first = {obj["index"] for obj in self.written()[:8 - len(calls[1])]}    # nhận được trước khi stream đứt
+        self.assertTrue(first)
+        self.assertEqual(calls[1], [i for i in range(1, 9) if i not in first])
+        self.assertEqual(usage["requests"], 2)
+        self.assertEqual(bad, [])
+        self.assertEqual(sorted(writer.checkpoint["done"]), sorted(f"e{i}" for i in range(1, 9)))
+
+    def test_partial_response_resends_only_missing_items(self):
+        def responder(seeds, n):
+            if n == 1:
+                seeds = [s for s in seeds if s["index"] not in (2, 5)]
+            return json.dumps([answer(s) for s in seeds]), False
+        self.fake.models.responder = responder
+        results, bad, usage = A.classify_items(make_items(6), self.limiter, self.make_writer())
+        self.assertEqual(self.fake.models.calls, [[1, 2, 3, 4, 5, 6], [2, 5]])
+        self.assertEqual(sorted(results), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(len(self.written()), 6)
+
+    def test_bisects_down_to_single_bad_item(self):
+        def responder(seeds, n):
+            if any(s["index"] == 3 for s in seeds):
+                return "Xin lỗi, tôi không thể trả lời.", False
+            return json.dumps([answer(s) for s in seeds]), False
+        self.fake.models.responder = responder
+        writer = self.make_writer()
+        results, bad, usage = A.classify_items(make_items(4), self.limiter, writer)
+        self.assertEqual(self.fake.models.calls, [[1, 2, 3, 4], [1, 2], [3, 4], [3], [4]])
+        self.assertEqual(sorted(results), [1, 2, 4])
+        self.assertEqual(len(bad), 3)
+        self.assertNotIn("e3", writer.checkpoint["done"])        # lần chạy sau sẽ thử lại bài 3
+
+    def test_cache_hits_skip_request(self):
+        cache = LLMCache(self.tmp / "llm_cache.jsonl")
+        items = make_items(4)
+        for item in items[:3]:
+            cache.put(A.cache_key(item), answer({"index": 0, "noi_dung": "cache"}))
+        results, bad, usage = A.classify_items(items, self.limiter, self.make_writer(cache))
+        self.assertEqual(self.fake.models.calls, [[4]])
+        self.assertEqual(sorted(results), [1, 2, 3, 4])
+        self.assertEqual(results[1]["index"], 1)                  # index theo bài, không theo giá trị cache
+        self.assertIsNotNone(cache.get(A.cache_key(items[3])))     # kết quả mới được cache
+
+        self.fake.models.calls.clear()
+        results, bad, usage = A.classify_items(items, self.limiter, self.make_writer(cache))
+        self.assertEqual(self.fake.models.calls, [])
+        self.assertEqual(usage["requests"], 0)
+
+    def test_context_cache_falls_back_when_create_fails(self):
+        self.assertIsNone(A.create_context_cache())
+        self.assertIn("system_instruction", A.generation_config())
+
+if __name__ == "__main__":
+    unittest.main()
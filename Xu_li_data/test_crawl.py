@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_crawl.py
+Test offline cho crawl.py, không gọi trang báo thật.
+
+- Cùng kết quả với cách làm cũ: summarize_batch ↔ extract_intelligent_summary (kể cả câu lặp),
+  classify_sentence ↔ các phép `kw in sentence.lower()` riêng lẻ.
+- ContainerWatcher (khớp nguyên token class, mọi cách cắt chunk), CircuitBreaker (closed → open → half-open).
+- Qua server HTTP local (127.0.0.1): breaker với host chết, new_items của feed, retry bài pending khi feed 304.
+
+Chạy: python -m pytest -q test_crawl.py   (hoặc python test_crawl.py)
+"""
+
+import logging
+import random
+import sys
+import threading
+import time
+import unittest
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+from typing import Callable, Dict, List, Optional, Tuple
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import crawl  # noqa: E402
+
+logging.disable(logging.CRITICAL)
+
+# ====== Tóm tắt / keyword: kết quả giống cách làm cũ ======
+SENTENCES = [
+    "Vụ cháy xảy ra tại phố Huế, quận Hai Bà Trưng, Hà Nội khiến 2 người bị thương.",
+    "Theo thông tin từ Công an TP Hà Nội, vụ va chạm gây ùn tắc kéo dài trên đường Láng.",
+    "Mưa lớn khiến nhiều tuyến phố ở Thủ đô ngập sâu, giao thông tê liệt trong nhiều giờ.",
+    "Lực lượng chức năng cho biết nguyên nhân vụ nổ đang được điều tra làm rõ.",
+    "Chia sẻ bài viết này lên mạng xã hội để nhận thông tin mới nhất.",
+    "Đọc thêm: Cảnh báo lũ lụt tại các tỉnh miền núi phía Bắc trong tuần tới?",
+    "Người dân Ha Noi phản ánh tình trạng kẹt xe vào giờ cao điểm sáng nay.",
+    "Ngắn quá.",
+    "!!! ??? ### $$$ %%% ^^^ &&& *** ((( ))) --- +++ ===",
+    "Cảnh sát đã bắt giữ nhóm đối tượng trộm cắp tài sản tại quận Cầu Giấy.",
+    "Ngôi nhà bị sập một phần, thiệt hại ước tính hàng trăm triệu đồng.",
+]
+
+def baseline_hits(sentence: str):
+    """Các phép `kw in sentence.lower()` riêng lẻ như trước khi có classify_sentence"""
+    text = sentence.lower()
+    return (
+        any(noise in text for noise in crawl.NOISE_KEYWORDS),
+        any(word in text for word in crawl.MEANINGFUL_WORDS),
+        sum(1 for kw in crawl.HANOI_KEYWORDS if kw.lower() in text),
+        sum(1 for indicator in crawl.IMPORTANT_INDICATORS if indicator in text),
+    )
+
+class KeywordParityTest(unittest.TestCase):
+    def corpus(self) -> List[str]:
+        # Câu ghép ngẫu nhiên từ keyword (chồng lấn, tiền tố, hoa/thường) + câu mẫu
+        rng = random.Random(7)
+        keywords = crawl.NOISE_KEYWORDS + crawl.MEANINGFUL_WORDS + crawl.HANOI_KEYWORDS + crawl.IMPORTANT_INDICATORS
+        filler = ["xe", "nhà", "phố", "sáng", "nay", "ra", "đổ", "chá", "HÀ", "nội"]
+        generated = []
+        for _ in range(500):
+            words = rng.choices(keywords + filler, k=rng.randint(1, 12))
+            joiner = rng.choice([" ", "", ", "])
+            text = joiner.join(words)
+            generated.append(text.upper() if rng.random() < 0.1 else text)
+        return SENTENCES + generated
+
+    def test_classify_sentence_matches_baseline_checks(self):
+        for sentence in self.corpus():
+            hits = crawl.classify_sentence(sentence)
+            noise, meaningful, hanoi, indicators = baseline_hits(sentence)
+            self.assertEqual((bool(hits.noise), bool(hits.meaningful), hits.hanoi, hits.indicators),
+                             (noise, meaningful, hanoi, indicators), sentence)
+
+class SummarizeBatchTest(unittest.TestCase):
+    def articles(self) -> List[Tuple[str, str]]:
+        rng = random.Random(11)
+        articles = [
+            ("trống", ""),
+            ("một câu", SENTENCES[0]),
+            # Câu lặp lại trong cùng bài và giữa các bài (offset khác nhau, cùng điểm)
+            ("lặp", " ".join([SENTENCES[0], SENTENCES[3], SENTENCES[0], SENTENCES[3], SENTENCES[0]])),
+            ("lặp 2", " ".join([SENTENCES[3]] * 6 + [SENTENCES[1]])),
+            ("toàn nhiễu", " ".join([SENTENCES[4], SENTENCES[7], SENTENCES[8]])),
+        ]
+        for i in range(30):
+            sentences = rng.choices(SENTENCES, k=rng.randint(1, 25))
+            articles.append((f"bài {i}", " ".join(sentences)))
+        return articles
+
+    def test_matches_extract_intelligent_summary(self):
+        articles = self.articles()
+        expected = [crawl.extract_intelligent_summary(title, content) for title, content in articles]
+        self.assertEqual(crawl.summarize_batch(articles), expected)
+
+    def test_single_article_batches(self):
+        for title, content in self.articles()[:5]:
+            self.assertEqual(crawl.summarize_batch([(title, content)]),
+                             [crawl.extract_intelligent_summary(title, content)])
+
+    def test_empty_batch(self):
+        self.assertEqual(crawl.summarize_batch([]), [])
+
+# ====== Stream trang bài: ContainerWatcher ======
+class ContainerWatcherTest(unittest.TestCase):
+    PAGE = (
+        b'<html><head><title>t</title></head><body>'
+        b'<article class="fck_detail-top">trang tr\xc3\xad</article>'          # token khác: không khớp
+        b'<article class="x fck_detail">n\xe1\xbb\x99i dung'
+        b'<article class="quote">tr\xc3\xadch</article><ARTICLE>l\xe1\xbb\x93ng</ARTICLE>'
+        b'h\xe1\xba\xbft</article>'
+        b'<footer>' + b'x' * 3000 + b'</footer></body></html>'
+    )
+    CLOSED_AT = PAGE.index(b'</footer>') - len(b'<footer>') - len(b'x' * 3000)
+
+    def feed_chunks(self, watcher, page: bytes, size: int) -> Optional[int]:
+        """Số byte đã nhận khi watcher báo container đóng (None nếu không bao giờ)"""
+        buf = bytearray()
+        for i in range(0, len(page), size):
+            buf.extend(page[i:i + size])
+            if watcher.feed(buf):
+                return len(buf)
+        return None
+
+    def test_stops_right_after_container_closes_for_any_chunk_size(self):
+        for size in (1, 2, 3, 5, 7, 16, 64, 1024, len(self.PAGE)):
+            stopped = self.feed_chunks(crawl.ContainerWatcher("article", "class", "fck_detail"), self.PAGE, size)
+            self.assertIsNotNone(stopped, size)
+            self.assertGreaterEqual(stopped, self.CLOSED_AT, size)     # không dừng trước thẻ đóng thật
+            self.assertLess(stopped, self.CLOSED_AT + size + len(b'</article>') + 2, size)
+
+    def test_matches_whole_class_token_only(self):
+        for value in (b"fck_detail-top", b"fck_detail_x", b"x-fck_detail"):
+            page = b'<body><article class="' + value + b'">a</article><p>' + b'y' * 100 + b'</p></body>'
+            self.assertIsNone(self.feed_chunks(crawl.ContainerWatcher("article", "class", "fck_detail"), page, 4), value)
+        for attrs in (b'class="fck_detail"', b"class='a fck_detail b'", b'id="x" class="fck_detail\tb"'):
+            page = b'<body><article ' + attrs + b'>a</article><p>' + b'y' * 100 + b'</p></body>'
+            self.assertIsNotNone(self.feed_chunks(crawl.ContainerWatcher("article", "class", "fck_detail"), page, 4), attrs)
+
+    def test_start_tag_split_across_chunks_far_into_page(self):
+        page = b'<body>' + b'z' * 5000 + self.PAGE[self.PAGE.index(b'<article class="x'):]
+        self.assertIsNotNone(self.feed_chunks(crawl.ContainerWatcher("article", "class", "fck_detail"), page, 700))
+
+# ====== CircuitBreaker ======
+class CircuitBreakerTest(unittest.TestCase):
+    def test_state_transitions(self):
+        breaker = crawl.CircuitBreaker(threshold=3, cooldown=0.05, max_cooldown=0.15)
+        # closed: lỗi dưới ngưỡng vẫn cho qua
+        self.assertFalse(breaker.record_failure())
+        self.assertFalse(breaker.record_failure())
+        self.assertTrue(breaker.allow())
+        # closed → open ở lỗi thứ threshold
+        self.assertTrue(breaker.record_failure())
+        self.assertTrue(breaker.is_open())
+        self.assertFalse(breaker.allow())
+        self.assertFalse(breaker.record_failure())      # lỗi của request đang bay không mở lại
+        # hết cooldown → half-open: đúng 1 request thử
+        time.sleep(0.06)
+        self.assertFalse(breaker.is_open())              # is_open() chỉ xem, không giữ lượt thử
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.is_open())
+        self.assertFalse(breaker.allow())
+        # thử lỗi → open lại, cooldown gấp đôi
+        self.assertTrue(breaker.record_failure())
+        self.assertAlmostEqual(breaker.cooldown, 0.1)
+        time.sleep(0.06)
+        self.assertFalse(breaker.allow())
+        time.sleep(0.05)
+        self.assertTrue(breaker.allow())
+        # cooldown không vượt max_cooldown
+        breaker.record_failure()
+        self.assertAlmostEqual(breaker.cooldown, 0.15)
+        time.sleep(0.16)
+        # thử thành công → closed, cooldown về mức gốc
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open())
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+        self.assertEqual((breaker.failures, breaker.cooldown), (0, 0.05))
+
+    def test_open_for_retry_after(self):
+        breaker = crawl.CircuitBreaker(threshold=3, cooldown=0.05, max_cooldown=0.1)
+        breaker.open_for(60)                            # bị chặn ở max_cooldown
+        self.assertFalse(breaker.allow())
+        time.sleep(0.11)
+        self.assertTrue(breaker.allow())
+
+# ====== Server local ======
+class LocalServer:
+    """
+    ThreadingHTTPServer trên 127.0.0.1, mỗi GET trả về respond(path, headers) → (status, headers, body);
+    đếm số lần bị gọi.
+    """
+
+    def __init__(self, respond: Callable[[str, Dict[str, str]], Tuple[int, Dict[str, str], bytes]]):
+        self.hits = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.hits += 1
+                status, headers, body = respond(self.path, dict(self.headers))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.host = crawl.get_host(self.base_url)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def articles(self, count: int) -> List[Dict]:
+        return [{'url': f"{self.base_url}/bai-{i}.html", 'title': f"bài {i}", 'source': 'test'} for i in range(count)]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class LocalServerTest(unittest.TestCase):
+    """setUp dựng server, nới token bucket, tắt HTML cache, frontier rỗng riêng cho test; dọn state theo host khi xong"""
+
+    def respond(self, path: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        raise NotImplementedError
+
+    def setUp(self):
+        self.server = LocalServer(self.respond)
+        self.addCleanup(self.server.close)
+        patches = [
+            mock.patch.dict(crawl.HOST_RATES, {self.server.host: (50.0, 2)}),
+            mock.patch.object(crawl, "backoff_delay", lambda attempt: 0.01),
+            mock.patch.object(crawl, "HTML_CACHE_ENABLED", False),
+            mock.patch.object(crawl, "_seen_urls", {}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        for state in (crawl._host_buckets, crawl._host_breakers):
+            state.pop(self.server.host, None)
+            self.addCleanup(state.pop, self.server.host, None)
+
+# ====== Circuit breaker ======
+class DeadHostTest(LocalServerTest):
+    """Host lỗi liên tục: breaker mở sau BREAKER_THRESHOLD lỗi, các bài còn lại không được gửi đi nữa"""
+
+    ARTICLES = 40
+    # Request đang bay lúc breaker mở vẫn tới server: cho phép thêm tối đa số kết nối song song
+    MAX_IN_FLIGHT = 4
+
+    def respond(self, path, headers):
+        return 503, {}, b""
+
+    def assert_fails_fast(self):
+        self.assertTrue(crawl.host_breaker(self.server.base_url).is_open())
+        self.assertLessEqual(self.server.hits, crawl.BREAKER_THRESHOLD + self.MAX_IN_FLIGHT)
+
+    def test_thread_engine_stops_sending_after_breaker_opens(self):
+        events = crawl.process_articles_parallel(self.server.articles(self.ARTICLES), set(), max_workers=self.MAX_IN_FLIGHT)
+        self.assertEqual(events, [])
+        self.assert_fails_fast()
+
+    @unittest.skipUnless(crawl.AIOHTTP_AVAILABLE, "aiohttp chưa cài")
+    def test_async_engine_stops_sending_after_breaker_opens(self):
+        # Mọi task bắt đầu cùng lúc và chờ token bucket: breaker phải được kiểm tra lại trước khi gửi
+        events = crawl.process_articles_async(self.server.articles(self.ARTICLES), set(), max_inflight=self.ARTICLES,
+                                              per_host=self.MAX_IN_FLIGHT, parse_workers=2)
+        self.assertEqual(events, [])
+        self.assert_fails_fast()
+
+# ====== Daemon: chu kỳ poll ======
+class FeedPollTest(LocalServerTest):
+    """new_items chỉ đếm entry chưa có ở lần parse trước: 304 / body không đổi → 0, feed giãn chu kỳ poll"""
+
+    def setUp(self):
+        self.items = ["tin-1", "tin-2"]
+        self.etag = '"v1"'
+        super().setUp()
+        self.rss_url = f"{self.server.base_url}/rss"
+        self.addCleanup(crawl._feed_cache.pop, self.rss_url, None)
+
+    def respond(self, path, headers):
+        if headers.get("If-None-Match") == self.etag:
+            return 304, {}, b""
+        now = formatdate(usegmt=True)
+        items = "".join(f"<item><title>{slug}</title><link>{self.server.base_url}/{slug}.html</link>"
+                        f"<pubDate>{now}</pubDate></item>" for slug in self.items)
+        body = f'<?xml version="1.0"?><rss version="2.0"><channel><title>t</title>{items}</channel></rss>'
+        return 200, {"Content-Type": "application/rss+xml", "ETag": self.etag}, body.encode()
+
+    def poll(self) -> Tuple[int, int]:
+        articles = crawl.crawl_single_feed("test", self.rss_url)
+        return len(articles), crawl.get_feed_cache(self.rss_url)["new_items"]
+
+    def test_new_items_counts_only_entries_missing_from_previous_parse(self):
+        self.assertEqual(self.poll(), (2, 2))
+        # 304: 2 entry chưa tải vẫn được trả lại để retry, nhưng không phải bài mới
+        self.assertEqual(self.poll(), (2, 0))
+        self.assertEqual(self.poll(), (2, 0))
+        self.items.append("tin-3")
+        self.etag = '"v2"'
+        self.assertEqual(self.poll(), (3, 1))
+
+# ====== Feed 304: chỉ retry lỗi tạm thời ======
+class RetryPendingTest(LocalServerTest):
+    """Bài liệt kê trong feed nhưng không tải được: lỗi tạm thời (503) được trả lại khi feed 304, lỗi vĩnh viễn thì không"""
+
+    PAGES = {
+        "/mat-bai.html": (404, "text/html", "Cháy nhà ở Hà Nội"),
+        "/tai-lieu.html": (200, "application/pdf", "Tai nạn ở Hà Nội"),
+        "/dang-loi.html": (503, "text/html", "Ngập úng ở Hà Nội"),
+        "/kinh-doanh/gia-vang.html": (200, "text/html", "Giá vàng tại Đà Nẵng hôm nay"),   # prefilter bỏ
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.rss_url = f"{self.server.base_url}/rss"
+        self.addCleanup(crawl._feed_cache.pop, self.rss_url, None)
+
+    def respond(self, path, headers):
+        if path == "/rss":
+            if headers.get("If-None-Match") == '"v1"':
+                return 304, {}, b""
+            now = formatdate(usegmt=True)
+            items = "".join(f"<item><title>{title}</title><link>{self.server.base_url}{page}</link>"
+                            f"<pubDate>{now}</pubDate></item>" for page, (_, _, title) in self.PAGES.items())
+            body = f'<?xml version="1.0"?><rss version="2.0"><channel><title>t</title>{items}</channel></rss>'
+            return 200, {"Content-Type": "application/rss+xml", "ETag": '"v1"'}, body.encode()
+        status, content_type, _ = self.PAGES[path]
+        return status, {"Content-Type": content_type}, b"%PDF-1.4" if status == 200 else b""
+
+    def test_304_retries_only_transient_failures(self):
+        articles = crawl.crawl_single_feed("test", self.rss_url)
+        self.assertEqual(len(articles), 4)
+        for article in crawl.prefilter_articles(articles):
+            self.assertEqual(crawl.fetch_html(article['url']), (None, False))
+
+        retried = crawl.crawl_single_feed("test", self.rss_url)
+        self.assertEqual([urlsplit(a['url']).path for a in retried], ["/dang-loi.html"])
+
+if __name__ == "__main__":
+    unittest.main()